@@ -59,9 +59,10 @@ def advanced_scenario_analysis():
     
     print("\n📊 Ejecutando simulaciones de alta precisión (20,000 iteraciones)...")
     
-    for profile, scenario in scenarios.items():
+    batch_results = engine.simulate_many(list(scenarios.values()))
+    
+    for profile, result in zip(scenarios, batch_results):
         print(f"\n🔄 Analizando perfil {profile}...")
-        result = engine.simulate_scenario(scenario)
         results[profile] = result
         
         metrics = StatisticsCalculator.calculate_risk_metrics(result)
@@ -60,14 +60,14 @@ def demo_simulation():
     
     # Motor de simulación
     engine = MonteCarloEngine(n_simulations=10000)
-    results = []
     
     print("\nEjecutando simulaciones Monte Carlo...")
     
-    for scenario in scenarios:
-        print(f"\n Simulando: {scenario.name}")
-        result = engine.simulate_scenario(scenario)
-        results.append(result)
+    # Todos los escenarios se simulan en una sola pasada vectorizada
+    results = engine.simulate_many(scenarios)
+    
+    for scenario, result in zip(scenarios, results):
+        print(f"\n Escenario: {scenario.name}")
         
         # Mostrar resultados básicos
         metrics = StatisticsCalculator.calculate_risk_metrics(result)
@@ -4,16 +4,25 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 
 from src.ui.dashboard import DecisionDashboard
 
-def handler(event, context):
-    """Función serverless para Netlify"""
-    try:
+# Se reutiliza entre invocaciones del mismo contenedor (solo se construye en el arranque en frío)
+_dashboard = None
+
+def get_dashboard() -> DecisionDashboard:
+    global _dashboard
+    if _dashboard is None:
         dashboard = DecisionDashboard()
-        app = dashboard.app
         
         # Configurar para serverless
-        app.config.update({
+        dashboard.app.config.update({
             'suppress_callback_exceptions': True
         })
+        _dashboard = dashboard
+    return _dashboard
+
+def handler(event, context):
+    """Función serverless para Netlify"""
+    try:
+        get_dashboard()
         
         return {
             'statusCode': 200,
@@ -0,0 +1 @@
+# API HTTP/JSON de simulación
\ No newline at end of file
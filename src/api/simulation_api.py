@@ -0,0 +1,222 @@
+import gzip
+import json
+import math
+import base64
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from dataclasses import MISSING, fields
+from typing import Dict, Optional, Tuple
+from flask import Blueprint, Flask, Response, request
+from werkzeug.exceptions import RequestEntityTooLarge
+from ..database.array_codec import COMPRESSIONS, encode_arrays
+from ..models.business_scenario import BusinessScenario, SimulationResult
+from ..simulation.service import SimulationService
+
+SCENARIO_FIELDS = {field.name for field in fields(BusinessScenario)}
+REQUIRED_FIELDS = {field.name for field in fields(BusinessScenario) if field.default is MISSING}
+RESULT_ARRAYS = ('net_present_values', 'roi_values', 'break_even_months')
+# Límites de la entrada: el kernel reserva trayectorias × 4 × meses normales y el
+# nombre se guarda en un VARCHAR(255)
+MAX_TIME_HORIZON = 600
+MAX_NAME_LENGTH = 255
+NON_NEGATIVE_FIELDS = ('revenue_std', 'cost_std', 'market_volatility')
+
+class ApiError(Exception):
+    """Error de la petición que se devuelve como JSON con su código HTTP"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class SimulationAPI:
+    """API JSON de simulación montada sobre el servidor Flask de una app Dash
+
+    POST /api/simulate recibe {"scenario": {...}} y POST /api/simulate/batch
+    {"scenarios": [...]}, con los campos de BusinessScenario. Cada resultado trae
+    las métricas de riesgo y, con "arrays": true, los arrays de trayectorias
+    empaquetados con encode_arrays (float32, comprimidos, en base64). Las
+    simulaciones pasan por el SimulationService compartido, así que comparten su
+    caché de resultados y su persistencia con la UI; un lote simula sus escenarios
+    no cacheados en una sola pasada vectorizada.
+
+    A lo sumo max_concurrent peticiones simulan a la vez; las que no consiguen
+    turno en queue_timeout segundos reciben 503 con Retry-After. Las respuestas
+    se guardan por cuerpo de petición en un LRU de response_cache_size entradas
+    y se envían con gzip si el cliente lo acepta. El cuerpo, el horizonte
+    (MAX_TIME_HORIZON meses) y el nombre tienen tamaño acotado.
+    """
+
+    max_batch = 100
+    # Tamaño máximo del cuerpo (MAX_CONTENT_LENGTH del servidor si no tiene uno)
+    max_body_bytes = 1024 * 1024
+    # Por debajo de este tamaño comprimir no compensa
+    gzip_min_bytes = 1024
+
+    def __init__(self, service: SimulationService, max_concurrent: int = 4, queue_timeout: float = 5.0,
+                 response_cache_size: int = 256):
+        self.service = service
+        self.queue_timeout = queue_timeout
+        self.response_cache_size = response_cache_size
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._responses: 'OrderedDict[str, Tuple[bytes, Optional[bytes]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, server: Flask):
+        """Agrega las rutas /api/simulate y /api/simulate/batch al servidor"""
+        blueprint = Blueprint('simulation_api', __name__, url_prefix='/api')
+        blueprint.add_url_rule('/simulate', 'simulate', self.simulate, methods=['POST'])
+        blueprint.add_url_rule('/simulate/batch', 'simulate_batch', self.simulate_batch, methods=['POST'])
+        server.register_blueprint(blueprint)
+        if server.config.get('MAX_CONTENT_LENGTH') is None:
+            server.config['MAX_CONTENT_LENGTH'] = self.max_body_bytes
+
+    def simulate(self) -> Response:
+        return self._handle(lambda payload: self._simulate_one(payload.get('scenario'), payload))
+
+    def simulate_batch(self) -> Response:
+        def run(payload):
+            scenarios = payload.get('scenarios')
+            if not isinstance(scenarios, list) or not scenarios:
+                raise ApiError("'scenarios' debe ser una lista no vacía")
+            if len(scenarios) > self.max_batch:
+                raise ApiError(f"El lote admite a lo sumo {self.max_batch} escenarios", 413)
+            parsed = [_parse_scenario(scenario) for scenario in scenarios]
+            try:
+                results = self.service.simulate_many(parsed)
+            except (TypeError, ValueError) as e:
+                raise ApiError(f"Lote inválido: {e}")
+            return {'results': [self._result_response(scenario, result, payload)
+                                for scenario, result in zip(parsed, results)]}
+        return self._handle(run)
+
+    def _handle(self, run) -> Response:
+        try:
+            body = request.get_data()
+        except RequestEntityTooLarge:
+            return self._error(f"El cuerpo supera el máximo de {request.max_content_length} bytes", 413)
+        key = hashlib.sha256(request.path.encode() + b'\0' + body).hexdigest()
+        cached = self._cached_response(key)
+        if cached is None:
+            try:
+                payload = json.loads(body or b'null')
+            except ValueError as e:
+                return self._error(f"JSON inválido: {e}", 400)
+            try:
+                if not isinstance(payload, dict):
+                    raise ApiError("El cuerpo debe ser un objeto JSON")
+                if not self._slots.acquire(timeout=self.queue_timeout):
+                    raise ApiError("Demasiadas simulaciones en curso, reintente más tarde", 503)
+                try:
+                    data = run(payload)
+                finally:
+                    self._slots.release()
+            except ApiError as e:
+                return self._error(str(e), e.status)
+            cached = self._store_response(key, json.dumps(data, default=_to_json, allow_nan=False).encode())
+        return self._response(*cached)
+
+    def _simulate_one(self, scenario_data, payload: Dict) -> Dict:
+        scenario = _parse_scenario(scenario_data)
+        try:
+            result = self.service.simulate(scenario)
+        except (TypeError, ValueError) as e:
+            raise ApiError(f"Escenario inválido '{scenario.name}': {e}")
+        return self._result_response(scenario, result, payload)
+
+    def _result_response(self, scenario: BusinessScenario, result: SimulationResult, payload: Dict) -> Dict:
+        response = {'scenario': scenario.name, 'n_simulations': len(result.net_present_values),
+                    'metrics': _finite(self.service.metrics(result))}
+        if payload.get('arrays'):
+            response['arrays'] = _encode_result_arrays(result, payload.get('compression'))
+        return response
+
+    def _cached_response(self, key: str) -> Optional[Tuple[bytes, Optional[bytes]]]:
+        with self._lock:
+            cached = self._responses.get(key)
+            if cached is not None:
+                self._responses.move_to_end(key)
+            return cached
+
+    def _store_response(self, key: str, raw: bytes) -> Tuple[bytes, Optional[bytes]]:
+        compressed = gzip.compress(raw, compresslevel=5) if len(raw) >= self.gzip_min_bytes else None
+        with self._lock:
+            self._responses[key] = (raw, compressed)
+            while len(self._responses) > self.response_cache_size:
+                self._responses.popitem(last=False)
+        return raw, compressed
+
+    def _response(self, raw: bytes, compressed: Optional[bytes]) -> Response:
+        accepts_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+        response = Response(compressed if compressed and accepts_gzip else raw, mimetype='application/json')
+        if compressed and accepts_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    @staticmethod
+    def _error(message: str, status: int) -> Response:
+        response = Response(json.dumps({'error': message}), status=status, mimetype='application/json')
+        if status == 503:
+            response.headers['Retry-After'] = '1'
+        return response
+
+
+def register_simulation_api(server: Flask, service: SimulationService, **options) -> SimulationAPI:
+    """Monta la API JSON de simulación en el servidor Flask de una app Dash"""
+    api = SimulationAPI(service, **options)
+    api.register(server)
+    return api
+
+
+def _parse_scenario(data) -> BusinessScenario:
+    if not isinstance(data, dict):
+        raise ApiError("Cada escenario debe ser un objeto JSON")
+    unknown = set(data) - SCENARIO_FIELDS
+    if unknown:
+        raise ApiError(f"Campos desconocidos en el escenario: {', '.join(sorted(unknown))}")
+    for name, value in data.items():
+        if name == 'name':
+            if not isinstance(value, str) or not 0 < len(value) <= MAX_NAME_LENGTH:
+                raise ApiError(f"El campo 'name' debe ser texto de 1 a {MAX_NAME_LENGTH} caracteres")
+        elif name == 'time_horizon':
+            if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= MAX_TIME_HORIZON:
+                raise ApiError(f"El campo 'time_horizon' debe ser un entero entre 1 y {MAX_TIME_HORIZON} (meses)")
+        elif isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ApiError(f"El campo '{name}' debe ser numérico")
+        elif name in NON_NEGATIVE_FIELDS and value < 0:
+            raise ApiError(f"El campo '{name}' no puede ser negativo")
+    missing = REQUIRED_FIELDS - set(data)
+    if missing:
+        raise ApiError(f"Faltan campos en el escenario: {', '.join(sorted(missing))}")
+    return BusinessScenario(**data)
+
+
+def _encode_result_arrays(result: SimulationResult, compression: Optional[str]) -> Dict:
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ApiError(f"Compresión no soportada: {compression}")
+    arrays = {name: getattr(result, name).astype(np.float32) for name in RESULT_ARRAYS}
+    if result.weights is not None:
+        arrays['weights'] = result.weights.astype(np.float32)
+    try:
+        payload, metadata = encode_arrays(arrays, compression)
+    except ValueError as e:  # p. ej. zstd pedido sin el paquete zstandard
+        raise ApiError(str(e))
+    return {'data': base64.b64encode(payload).decode('ascii'), 'metadata': metadata}
+
+
+def _finite(metrics: Dict) -> Dict:
+    # JSON no admite inf/NaN (p. ej. coeficiente de variación con media cero)
+    values = {key: value.item() if isinstance(value, np.generic) else value for key, value in metrics.items()}
+    return {key: None if isinstance(value, float) and not math.isfinite(value) else value
+            for key, value in values.items()}
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
@@ -1,7 +1,8 @@
 import os
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from ..database.models import Base, User
+from ..database.models import User
+from ..database.pool import get_engine
+from ..database.schema import ensure_orm_schema
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,24 +12,16 @@ class AuthManager:
         self.database_url = os.getenv('DATABASE_URL')
         if not self.database_url:
             raise Exception("DATABASE_URL no encontrada")
-        self.engine = create_engine(self.database_url)
+        self.engine = get_engine(self.database_url)
         self.Session = sessionmaker(bind=self.engine)
-        Base.metadata.create_all(self.engine)
-        self._create_default_user()
     
-    def _create_default_user(self):
-        session = self.Session()
-        try:
-            if not session.query(User).filter_by(username='admin').first():
-                admin = User(username='admin', email='admin@sistema.com')
-                admin.set_password('admin123')
-                session.add(admin)
-                session.commit()
-        finally:
-            session.close()
+    def _session(self):
+        """Sesión nueva; la primera del proceso crea tablas y usuario admin si faltan"""
+        ensure_orm_schema(self.engine)
+        return self.Session()
     
     def login(self, username, password):
-        session = self.Session()
+        session = self._session()
         try:
             user = session.query(User).filter_by(username=username, is_active=True).first()
             if user and user.check_password(password):
@@ -38,7 +31,7 @@ class AuthManager:
             session.close()
     
     def create_user(self, username, email, password):
-        session = self.Session()
+        session = self._session()
         try:
             if session.query(User).filter_by(username=username).first():
                 return {'success': False, 'message': 'Usuario ya existe'}
@@ -52,7 +45,7 @@ class AuthManager:
             session.close()
     
     def get_users(self):
-        session = self.Session()
+        session = self._session()
         try:
             users = session.query(User).all()
             return [{'id': u.id, 'username': u.username, 'email': u.email, 'is_active': u.is_active} for u in users]
@@ -60,7 +53,7 @@ class AuthManager:
             session.close()
     
     def update_user(self, user_id, **kwargs):
-        session = self.Session()
+        session = self._session()
         try:
             user = session.query(User).get(user_id)
             if user:
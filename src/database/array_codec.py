@@ -0,0 +1,74 @@
+import zlib
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstd es opcional; sin él se usa zlib
+    zstandard = None
+
+COMPRESSIONS = ('zstd', 'zlib', 'none')
+
+def default_compression() -> str:
+    return 'zstd' if zstandard is not None else 'zlib'
+
+
+def encode_arrays(arrays: Dict[str, np.ndarray], compression: Optional[str] = None) -> Tuple[bytes, Dict]:
+    """Empaqueta varios arrays en un único bloque binario (para una columna BYTEA)
+
+    Los bytes de cada array se concatenan en orden y, opcionalmente, se
+    comprimen juntos. Devuelve el bloque y los metadatos (dtype, forma y
+    desplazamiento de cada array) necesarios para reconstruirlos.
+    """
+    compression = compression or default_compression()
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Compresión no soportada: {compression}")
+
+    layout = []
+    chunks = []
+    offset = 0
+    for name, values in arrays.items():
+        values = np.ascontiguousarray(values)
+        layout.append({'name': name, 'dtype': values.dtype.str, 'shape': list(values.shape), 'offset': offset})
+        chunks.append(values.tobytes())
+        offset += values.nbytes
+
+    payload = b''.join(chunks)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("La compresión zstd requiere el paquete zstandard")
+        payload = zstandard.ZstdCompressor(level=3).compress(payload)
+    elif compression == 'zlib':
+        payload = zlib.compress(payload, 1)
+
+    return payload, {'compression': compression, 'nbytes': offset, 'arrays': layout}
+
+
+def decode_arrays(payload, metadata: Dict) -> Dict[str, np.ndarray]:
+    """Reconstruye los arrays de encode_arrays como vistas (np.frombuffer) sobre el bloque
+
+    Sin compresión las vistas apuntan directamente al buffer recibido (p. ej. el
+    memoryview de psycopg2), sin copias. Los arrays devueltos son de solo lectura.
+    """
+    compression = metadata['compression']
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("Los datos están comprimidos con zstd y falta el paquete zstandard")
+        buffer = zstandard.ZstdDecompressor().decompress(bytes(payload), max_output_size=metadata['nbytes'])
+    elif compression == 'zlib':
+        buffer = zlib.decompress(payload)
+    else:
+        buffer = payload
+
+    arrays = {}
+    for entry in metadata['arrays']:
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        values = np.frombuffer(buffer, dtype=dtype, count=count, offset=entry['offset'])
+        arrays[entry['name']] = values.reshape(entry['shape'])
+    return arrays
+
+
+def compact_int_dtype(values: np.ndarray) -> np.dtype:
+    """Menor tipo entero sin signo capaz de representar valores enteros no negativos"""
+    return np.min_scalar_type(int(values.max())) if values.size else np.dtype(np.uint8)
@@ -1,9 +1,10 @@
 import os
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 from dotenv import load_dotenv
-from .models import Base, SimulationRecord, Project
+from .models import SimulationRecord, Project
+from .pool import get_engine
+from .schema import ensure_orm_schema
 
 load_dotenv()
 
@@ -14,15 +15,19 @@ class DatabaseManager:
         self.database_url = os.getenv('DATABASE_URL')
         if not self.database_url:
             raise Exception("DATABASE_URL no encontrada en variables de entorno")
-        self.engine = create_engine(self.database_url)
+        self.engine = get_engine(self.database_url)
         self.Session = sessionmaker(bind=self.engine)
-        self.create_tables()
     
     def create_tables(self):
-        Base.metadata.create_all(self.engine)
+        ensure_orm_schema(self.engine)
+    
+    def _session(self):
+        """Sesión nueva; la primera del proceso crea las tablas si faltan"""
+        self.create_tables()
+        return self.Session()
     
     def save_simulation(self, scenario, result, metrics, project_id=1):
-        session = self.Session()
+        session = self._session()
         try:
             record = SimulationRecord(
                 project_id=project_id,
@@ -47,7 +52,7 @@ class DatabaseManager:
             session.close()
     
     def get_simulations(self, limit=50):
-        session = self.Session()
+        session = self._session()
         try:
             return session.query(SimulationRecord).order_by(SimulationRecord.created_at.desc()).limit(limit).all()
         finally:
@@ -1,61 +1,116 @@
 import psycopg2
+import psycopg2.extras
 import json
 import os
+import numpy as np
 from dotenv import load_dotenv
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import pandas as pd
+from .array_codec import compact_int_dtype, decode_arrays, encode_arrays
+from .pool import pooled_connection
+from .schema import ensure_schema
 
 load_dotenv()
 
+SCENARIO_COLUMNS = ('name', 'initial_investment', 'revenue_mean', 'revenue_std', 'cost_mean',
+                    'cost_std', 'inflation_rate', 'market_volatility', 'time_horizon')
+RESULT_COLUMNS = ('mean_npv', 'std_npv', 'success_probability', 'var_95', 'roi_mean',
+                  'break_even_mean', 'results_data', 'arrays_data', 'arrays_meta')
+
+# Escenarios y resultados en una sola sentencia: nextval reserva el id de cada
+# escenario (la CTE es volátil, se materializa una vez) y ambos INSERT lo usan.
+# Las CTE que modifican datos se ejecutan siempre; el SELECT final devuelve los
+# ids en el orden de las filas recibidas (position)
+SAVE_RUNS_SQL = f"""
+    WITH input AS (
+        SELECT nextval(pg_get_serial_sequence('scenarios', 'id')) AS scenario_id, v.*
+        FROM (VALUES %s) AS v (position, {', '.join(SCENARIO_COLUMNS + RESULT_COLUMNS)})
+    ), new_scenarios AS (
+        INSERT INTO scenarios (id, {', '.join(SCENARIO_COLUMNS)})
+        SELECT scenario_id, {', '.join(SCENARIO_COLUMNS)} FROM input
+    ), new_results AS (
+        INSERT INTO simulation_results (scenario_id, {', '.join(RESULT_COLUMNS)})
+        SELECT scenario_id, {', '.join(RESULT_COLUMNS)} FROM input
+    )
+    SELECT scenario_id FROM input ORDER BY position
+"""
+SAVE_RUNS_TEMPLATE = '(' + ', '.join(['%s'] * (1 + len(SCENARIO_COLUMNS) + len(RESULT_COLUMNS) - 3)
+                                     + ['%s::jsonb', '%s::bytea', '%s::jsonb']) + ')'
+
+def _create_base_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS scenarios (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            initial_investment DECIMAL(15,2),
+            revenue_mean DECIMAL(15,2),
+            revenue_std DECIMAL(15,2),
+            cost_mean DECIMAL(15,2),
+            cost_std DECIMAL(15,2),
+            inflation_rate DECIMAL(5,4),
+            market_volatility DECIMAL(5,4),
+            time_horizon INTEGER,
+            project_id INTEGER REFERENCES projects(id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS simulation_results (
+            id SERIAL PRIMARY KEY,
+            scenario_id INTEGER REFERENCES scenarios(id),
+            mean_npv DECIMAL(15,2),
+            std_npv DECIMAL(15,2),
+            success_probability DECIMAL(5,2),
+            var_95 DECIMAL(15,2),
+            roi_mean DECIMAL(8,2),
+            break_even_mean DECIMAL(8,2),
+            results_data JSONB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _add_binary_arrays(cur):
+    # Trayectorias en binario (ver array_codec); results_data queda solo con métricas
+    cur.execute("""
+        ALTER TABLE simulation_results
+            ADD COLUMN IF NOT EXISTS arrays_data BYTEA,
+            ADD COLUMN IF NOT EXISTS arrays_meta JSONB
+    """)
+
+# Migraciones de las tablas de NeonDB en orden; agregar pasos al final, nunca editarlos
+NEON_MIGRATIONS = [_create_base_tables, _add_binary_arrays]
+
 class NeonDB:
+    # Precisión de las trayectorias guardadas; las métricas se guardan aparte a precisión completa
+    array_dtype = np.float32
+    
     def __init__(self):
         self.connection_string = os.getenv('NEON_DATABASE_URL')
         if not self.connection_string:
             raise ValueError("NEON_DATABASE_URL no encontrada en variables de entorno")
     
     def get_connection(self):
+        """Conexión psycopg2 nueva y propia del llamador (debe cerrarla); sin pool"""
+        self.create_tables()
         return psycopg2.connect(self.connection_string)
     
+    def connection(self):
+        """Conexión del pool compartido del proceso (usar con with: confirma y la devuelve al salir)
+        
+        La primera conexión del proceso aplica las migraciones pendientes.
+        """
+        self.create_tables()
+        return pooled_connection(self.connection_string)
+    
     def create_tables(self):
-        """Crea las tablas necesarias"""
-        with self.get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS scenarios (
-                        id SERIAL PRIMARY KEY,
-                        name VARCHAR(255) NOT NULL,
-                        initial_investment DECIMAL(15,2),
-                        revenue_mean DECIMAL(15,2),
-                        revenue_std DECIMAL(15,2),
-                        cost_mean DECIMAL(15,2),
-                        cost_std DECIMAL(15,2),
-                        inflation_rate DECIMAL(5,4),
-                        market_volatility DECIMAL(5,4),
-                        time_horizon INTEGER,
-                        project_id INTEGER REFERENCES projects(id),
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS simulation_results (
-                        id SERIAL PRIMARY KEY,
-                        scenario_id INTEGER REFERENCES scenarios(id),
-                        mean_npv DECIMAL(15,2),
-                        std_npv DECIMAL(15,2),
-                        success_probability DECIMAL(5,2),
-                        var_95 DECIMAL(15,2),
-                        roi_mean DECIMAL(8,2),
-                        break_even_mean DECIMAL(8,2),
-                        results_data JSONB,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                conn.commit()
+        """Crea o actualiza las tablas necesarias (migraciones versionadas, una vez por proceso)"""
+        ensure_schema(self.connection_string, 'neon', NEON_MIGRATIONS,
+                      lambda: pooled_connection(self.connection_string))
     
     def save_scenario(self, scenario) -> int:
         """Guarda un escenario y retorna su ID"""
-        with self.get_connection() as conn:
+        with self.connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
                     INSERT INTO scenarios (name, initial_investment, revenue_mean, revenue_std,
@@ -68,27 +123,83 @@ class NeonDB:
     
     def save_simulation_result(self, scenario_id: int, result, metrics: Dict):
         """Guarda resultado de simulación"""
-        results_data = {
-            'npv_values': result.net_present_values.tolist(),
-            'roi_values': result.roi_values.tolist(),
-            'break_even_months': result.break_even_months.tolist(),
-            'metrics': metrics
-        }
+        results_data = {'metrics': metrics}
+        arrays_data, arrays_meta = self.encode_result_arrays(result)
         
-        with self.get_connection() as conn:
+        with self.connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
                     INSERT INTO simulation_results (scenario_id, mean_npv, std_npv, success_probability,
-                                                  var_95, roi_mean, break_even_mean, results_data)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (scenario_id, result.mean_npv, result.std_npv, result.success_probability,
-                     result.var_95, metrics.get('roi_medio', 0), metrics.get('break_even_medio', 0),
-                     json.dumps(results_data)))
+                                                  var_95, roi_mean, break_even_mean, results_data,
+                                                  arrays_data, arrays_meta)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, (scenario_id, float(result.mean_npv), float(result.std_npv), float(result.success_probability),
+                     float(result.var_95), float(metrics.get('roi_medio', 0)), float(metrics.get('break_even_medio', 0)),
+                     json.dumps(results_data), psycopg2.Binary(arrays_data), json.dumps(arrays_meta)))
                 conn.commit()
     
+    def save_run(self, scenario, result, metrics: Dict) -> int:
+        """Guarda escenario y resultado en una transacción y un solo viaje; retorna el ID del escenario"""
+        return self.save_runs([(scenario, result, metrics)])[0]
+    
+    def save_runs(self, runs: List[Tuple]) -> List[int]:
+        """Guarda varios (escenario, resultado, métricas) en una transacción con execute_values
+        
+        Retorna los IDs de los escenarios en el orden recibido.
+        """
+        rows = [(position,) + self._run_row(scenario, result, metrics)
+                for position, (scenario, result, metrics) in enumerate(runs)]
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                returned = psycopg2.extras.execute_values(cur, SAVE_RUNS_SQL, rows,
+                                                          template=SAVE_RUNS_TEMPLATE, fetch=True)
+        return [row[0] for row in returned]
+    
+    def _run_row(self, scenario, result, metrics: Dict) -> Tuple:
+        """Valores de una fila de SAVE_RUNS_SQL en el orden de SCENARIO_COLUMNS + RESULT_COLUMNS"""
+        arrays_data, arrays_meta = self.encode_result_arrays(result)
+        # float(): psycopg2 adapta los float por repr y los escalares de NumPy 2 no son literales SQL
+        numbers = [float(value) for value in (
+            scenario.initial_investment, scenario.revenue_mean, scenario.revenue_std, scenario.cost_mean,
+            scenario.cost_std, scenario.inflation_rate, scenario.market_volatility)]
+        numbers.append(int(scenario.time_horizon))
+        numbers.extend(float(value) for value in (
+            result.mean_npv, result.std_npv, result.success_probability, result.var_95,
+            metrics.get('roi_medio', 0), metrics.get('break_even_medio', 0)))
+        return (scenario.name, *numbers,
+                json.dumps({'metrics': metrics}), psycopg2.Binary(arrays_data), json.dumps(arrays_meta))
+    
+    def encode_result_arrays(self, result):
+        """Serializa NPV, ROI y break-even en un bloque binario comprimido y sus metadatos"""
+        break_even = result.break_even_months
+        return encode_arrays({
+            'npv_values': result.net_present_values.astype(self.array_dtype, copy=False),
+            'roi_values': result.roi_values.astype(self.array_dtype, copy=False),
+            'break_even_months': break_even.astype(compact_int_dtype(break_even), copy=False),
+        })
+    
+    def get_simulation_arrays(self, scenario_id: int) -> Optional[Dict[str, np.ndarray]]:
+        """Obtiene las trayectorias del último resultado de un escenario como arrays de NumPy"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT arrays_data, arrays_meta, results_data FROM simulation_results
+                    WHERE scenario_id = %s
+                    ORDER BY created_at DESC LIMIT 1
+                """, (scenario_id,))
+                row = cur.fetchone()
+        if not row:
+            return None
+        arrays_data, arrays_meta, results_data = row
+        if arrays_data is not None:
+            return decode_arrays(arrays_data, arrays_meta)
+        # Filas anteriores al formato binario: listas dentro de results_data
+        return {name: np.asarray(results_data[name])
+                for name in ('npv_values', 'roi_values', 'break_even_months') if name in results_data}
+    
     def get_scenarios(self) -> List[Dict]:
         """Obtiene todos los escenarios"""
-        with self.get_connection() as conn:
+        with self.connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT * FROM scenarios ORDER BY created_at DESC")
                 columns = [desc[0] for desc in cur.description]
@@ -96,7 +207,7 @@ class NeonDB:
     
     def get_simulation_results(self, scenario_id: int) -> Optional[Dict]:
         """Obtiene resultados de simulación por escenario"""
-        with self.get_connection() as conn:
+        with self.connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
                     SELECT * FROM simulation_results 
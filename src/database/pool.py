@@ -0,0 +1,142 @@
+import os
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+
+# Tamaño de los pools por proceso (la conexión TLS es el mayor coste de latencia):
+# las conexiones se abren a demanda y todas las devueltas quedan abiertas
+POOL_MAX_SIZE = 10
+# Neon cierra conexiones inactivas (y conn.closed no lo detecta hasta usar el
+# socket): al tomarlas, las inactivas más de POOL_PING_SECONDS se comprueban con
+# SELECT 1 y las inactivas más de POOL_RECYCLE_SECONDS se reemplazan
+POOL_PING_SECONDS = 30
+POOL_RECYCLE_SECONDS = 300
+
+_lock = threading.Lock()
+# Claves (pid, url): tras un fork cada worker abre sus propias conexiones
+_pools: Dict[Tuple[int, str], '_BlockingPool'] = {}
+_engines: Dict[Tuple[int, str], Engine] = {}
+
+
+class _BlockingPool:
+    """Pool psycopg2 que espera una conexión libre al agotarse y conserva las inactivas"""
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.available = threading.BoundedSemaphore(POOL_MAX_SIZE)
+        # Conexiones inactivas con su último uso; se reutiliza primero la más reciente
+        self.idle: List[Tuple[object, float]] = []
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def getconn(self):
+        self.available.acquire()
+        try:
+            while True:
+                with self._lock:
+                    if self.closed:
+                        raise psycopg2.InterfaceError("pool cerrado")
+                    conn, last_used = self.idle.pop() if self.idle else (None, None)
+                if conn is None:
+                    return psycopg2.connect(self.dsn)
+                if self._usable(conn, time.monotonic() - last_used):
+                    return conn
+                conn.close()
+        except Exception:
+            self.available.release()
+            raise
+
+    def putconn(self, conn, close: bool = False):
+        try:
+            if not close and not conn.closed:
+                status = conn.info.transaction_status
+                if status == TRANSACTION_STATUS_UNKNOWN:
+                    close = True
+                elif status != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            with self._lock:
+                if not (close or conn.closed or self.closed):
+                    self.idle.append((conn, time.monotonic()))
+                    return
+            conn.close()
+        finally:
+            self.available.release()
+
+    @staticmethod
+    def _usable(conn, idle: float) -> bool:
+        if conn.closed or idle > POOL_RECYCLE_SECONDS:
+            return False
+        if idle > POOL_PING_SECONDS:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def closeall(self):
+        with self._lock:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for conn, _ in idle:
+            conn.close()
+
+
+def get_pool(dsn: str) -> _BlockingPool:
+    """Pool psycopg2 compartido por el proceso para una cadena de conexión"""
+    key = (os.getpid(), dsn)
+    with _lock:
+        if key not in _pools:
+            _pools[key] = _BlockingPool(dsn)
+        return _pools[key]
+
+
+@contextmanager
+def pooled_connection(dsn: str):
+    """Toma una conexión del pool; confirma al salir, revierte si hay error y la devuelve"""
+    pool = get_pool(dsn)
+    conn = pool.getconn()
+    broken = False
+    try:
+        yield conn
+        conn.commit()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, close=broken)
+
+
+def get_engine(url: str) -> Engine:
+    """Engine de SQLAlchemy compartido por el proceso para una URL"""
+    key = (os.getpid(), url)
+    with _lock:
+        if key not in _engines:
+            _engines[key] = create_engine(url, pool_size=POOL_MAX_SIZE // 2, max_overflow=POOL_MAX_SIZE // 2,
+                                          pool_pre_ping=True, pool_recycle=POOL_RECYCLE_SECONDS)
+        return _engines[key]
+
+
+@atexit.register
+def close_all():
+    """Cierra las conexiones abiertas por este proceso"""
+    pid = os.getpid()
+    with _lock:
+        for (owner, dsn), pool in list(_pools.items()):
+            if owner == pid:
+                pool.closeall()
+                del _pools[(owner, dsn)]
+        for (owner, url), engine in list(_engines.items()):
+            if owner == pid:
+                engine.dispose()
+                del _engines[(owner, url)]
@@ -0,0 +1,106 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, ContextManager, List
+import psycopg2
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Engine
+
+# Tabla de versiones: una fila por componente (tablas de NeonDB y modelos ORM)
+SCHEMA_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        component VARCHAR(50) PRIMARY KEY,
+        version INTEGER NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+_lock = threading.Lock()
+# Componentes ya comprobados en este proceso: (pid, url, componente)
+_current = set()
+
+
+def ensure_schema(url: str, component: str, migrations: List[Callable], connect: Callable[[], ContextManager]):
+    """Aplica una sola vez por proceso las migraciones pendientes de un componente
+
+    migrations es la lista ordenada de pasos (el paso i lleva a la versión i + 1)
+    y cada uno recibe un cursor de la transacción de migración. connect() debe
+    devolver un context manager con una conexión DB-API que confirme al salir.
+    Si la versión guardada ya es la última basta una consulta; si no, los pasos
+    se ejecutan bajo un advisory lock para que varios procesos no migren a la vez.
+    """
+    key = (os.getpid(), url, component)
+    if key in _current:
+        return
+    with _lock:
+        if key in _current:
+            return
+        if _installed_version(component, connect) < len(migrations):
+            with connect() as conn:
+                with conn.cursor() as cur:
+                    _apply_migrations(cur, component, migrations)
+        _current.add(key)
+
+
+def _installed_version(component: str, connect: Callable[[], ContextManager]) -> int:
+    try:
+        with connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT version FROM schema_version WHERE component = %s", (component,))
+                row = cur.fetchone()
+                return row[0] if row else 0
+    except psycopg2.errors.UndefinedTable:
+        return 0
+
+
+def _apply_migrations(cur, component: str, migrations: List[Callable]):
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"schema_version:{component}",))
+    cur.execute(SCHEMA_VERSION_DDL)
+    cur.execute("SELECT version FROM schema_version WHERE component = %s", (component,))
+    row = cur.fetchone()
+    current = row[0] if row else 0
+    for migration in migrations[current:]:
+        migration(cur)
+    if len(migrations) > current:
+        cur.execute("""
+            INSERT INTO schema_version (component, version) VALUES (%s, %s)
+            ON CONFLICT (component) DO UPDATE SET version = EXCLUDED.version, applied_at = CURRENT_TIMESTAMP
+        """, (component, len(migrations)))
+
+
+def ensure_orm_schema(engine: 'Engine'):
+    """Tablas de los modelos ORM y usuario administrador por defecto
+
+    Los pasos usan la conexión de SQLAlchemy cuya conexión DB-API recibe
+    ensure_schema, así las tablas, el usuario y la versión se confirman en la
+    misma transacción, bajo el advisory lock.
+    """
+    # Import diferido: el motor de simulación usa este módulo sin necesitar SQLAlchemy
+    from sqlalchemy.orm import Session
+    from .models import Base, User
+    current = {}
+
+    @contextmanager
+    def connect():
+        with engine.begin() as connection:
+            current['connection'] = connection
+            try:
+                yield connection.connection.dbapi_connection
+            finally:
+                current.pop('connection', None)
+
+    def create_models(cur):
+        Base.metadata.create_all(bind=current['connection'])
+
+    def create_default_user(cur):
+        # La sesión se une a la transacción de la conexión: commit() no la confirma aún
+        with Session(bind=current['connection']) as session:
+            if not session.query(User).filter_by(username='admin').first():
+                admin = User(username='admin', email='admin@sistema.com')
+                admin.set_password('admin123')
+                session.add(admin)
+                session.commit()
+
+    url = engine.url.render_as_string(hide_password=False)
+    ensure_schema(url, 'orm', [create_models, create_default_user], connect)
@@ -0,0 +1,146 @@
+import time
+import queue
+import atexit
+import threading
+import psycopg2
+from collections import deque
+from typing import Dict, Optional
+
+# Errores de conexión que justifican reintentar; el resto (datos inválidos,
+# restricciones) fallaría igual en cada intento
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, ConnectionError)
+
+class WriteBehindQueue:
+    """Persistencia en segundo plano de simulaciones (write-behind)
+
+    submit() encola (escenario, resultado, métricas) y vuelve de inmediato; un
+    hilo agrupa lo pendiente en lotes de hasta batch_size y los guarda con
+    db.save_runs en una transacción. Los errores de conexión se reintentan con
+    espera exponencial; si el lote falla por otro motivo (p. ej. una fila con datos
+    inválidos) se guarda fila por fila con db.save_run y solo se pierden las filas
+    que fallan. La cola está acotada: si se llena, submit() espera (contrapresión)
+    en lugar de descartar resultados. Al terminar el proceso se vacía la cola (atexit).
+    """
+
+    def __init__(self, db, max_size: int = 1000, batch_size: int = 50,
+                 max_retries: int = 5, backoff: float = 0.5):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+        self.last_error: Optional[str] = None
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        # Momento de encolado de cada pendiente, en orden FIFO, para medir el retraso
+        self._enqueued_at: deque = deque()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, scenario, result, metrics: Dict):
+        """Encola una simulación para guardarla; solo bloquea si la cola está llena"""
+        with self._lock:
+            self._enqueued_at.append(time.monotonic())
+        self._queue.put((scenario, result, metrics))
+
+    def metrics(self) -> Dict:
+        """Profundidad de la cola, retraso del pendiente más antiguo (s) y contadores"""
+        with self._lock:
+            oldest = self._enqueued_at[0] if self._enqueued_at else None
+        return {
+            'depth': self._queue.qsize(),
+            'lag_seconds': time.monotonic() - oldest if oldest is not None else 0.0,
+            'written': self.written,
+            'failed': self.failed,
+            'retries': self.retries,
+            'last_error': self.last_error,
+        }
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que se procese todo lo encolado; False si vence el timeout"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = 30.0):
+        """Vacía la cola y detiene el hilo de escritura"""
+        if self._stopping.is_set():
+            return
+        self.flush(timeout)
+        self._stopping.set()
+        self._thread.join(timeout=1.0)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                batch = [self._queue.get(timeout=0.2)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                with self._lock:
+                    for _ in batch:
+                        self._enqueued_at.popleft()
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        try:
+            self._save_with_retries(self.db.save_runs, batch)
+        except TRANSIENT_ERRORS:
+            self._drop(len(batch), f"tras {self.max_retries} reintentos")
+            return
+        except Exception as e:
+            self.last_error = str(e)
+            if len(batch) == 1:
+                self._drop(1, "(error permanente)")
+            else:
+                print(f"⚠️ Lote rechazado por la base de datos, se guarda fila por fila: {e}")
+                self._write_rows(batch)
+            return
+        self.written += len(batch)
+        print(f"✅ {len(batch)} escenarios guardados en base de datos")
+
+    def _write_rows(self, batch):
+        saved = 0
+        for run in batch:
+            try:
+                self._save_with_retries(self.db.save_run, *run)
+                saved += 1
+            except Exception as e:
+                self.last_error = str(e)
+                self._drop(1, f"'{getattr(run[0], 'name', run[0])}'")
+        self.written += saved
+        if saved:
+            print(f"✅ {saved} escenarios guardados en base de datos")
+
+    def _save_with_retries(self, save, *args):
+        """Llama a save reintentando con espera exponencial solo los errores de conexión"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return save(*args)
+            except TRANSIENT_ERRORS as e:
+                self.last_error = str(e)
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def _drop(self, count: int, detail: str):
+        self.failed += count
+        print(f"⚠️ Error guardando en base de datos {detail}: {self.last_error}")
@@ -1,5 +1,5 @@
 import numpy as np
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Dict, List, Optional
 
 @dataclass
@@ -15,6 +15,35 @@ class BusinessScenario:
     market_volatility: float = 0.15
     time_horizon: int = 12  # meses
 
+@dataclass
+class ScenarioBatch:
+    """Parámetros de varios escenarios con el mismo horizonte, apilados para simularlos juntos
+
+    Cada parámetro es un array con forma (escenarios, 1, 1) que se combina por
+    broadcasting con normales de forma (escenarios, trayectorias, 4, meses).
+    """
+    names: List[str]
+    initial_investment: np.ndarray
+    revenue_mean: np.ndarray
+    revenue_std: np.ndarray
+    cost_mean: np.ndarray
+    cost_std: np.ndarray
+    inflation_rate: np.ndarray
+    market_volatility: np.ndarray
+    time_horizon: int
+
+    PARAMETERS = ('initial_investment', 'revenue_mean', 'revenue_std', 'cost_mean',
+                  'cost_std', 'inflation_rate', 'market_volatility')
+
+    @classmethod
+    def from_scenarios(cls, scenarios: List[BusinessScenario]) -> 'ScenarioBatch':
+        horizons = {scenario.time_horizon for scenario in scenarios}
+        if len(horizons) != 1:
+            raise ValueError("Todos los escenarios del lote deben tener el mismo horizonte")
+        columns = {name: np.array([getattr(s, name) for s in scenarios], dtype=float).reshape(-1, 1, 1)
+                   for name in cls.PARAMETERS}
+        return cls(names=[s.name for s in scenarios], time_horizon=horizons.pop(), **columns)
+
 @dataclass
 class SimulationResult:
     """Resultado de simulación Monte Carlo"""
@@ -27,4 +56,24 @@ class SimulationResult:
     std_npv: float
     percentile_5: float
     percentile_95: float
-    var_95: float  # Value at Risk al 95%
\ No newline at end of file
+    var_95: float  # Value at Risk al 95%
+    # Precisión alcanzada: error estándar de mean_npv y de success_probability (puntos %)
+    std_error_npv: Optional[float] = None
+    std_error_success: Optional[float] = None
+    # Varianza de un Monte Carlo simple dividida por la del estimador usado (1 = sin reducción)
+    variance_reduction_factor: Optional[float] = None
+    # Razones de verosimilitud por trayectoria cuando se usa muestreo por importancia
+    weights: Optional[np.ndarray] = field(default=None, repr=False, compare=False)
+    # Caché de StatisticsCalculator.calculate_risk_metrics (o agregados en línea si se omiten los arrays)
+    risk_metrics: Optional[Dict] = field(default=None, repr=False, compare=False)
+
+@dataclass
+class SimulationProgress:
+    """Avance de una simulación por bloques con el resultado parcial acumulado"""
+    completed: int
+    total: int
+    result: SimulationResult
+
+    @property
+    def done(self) -> bool:
+        return self.completed >= self.total
@@ -0,0 +1,160 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import numpy as np
+from collections import OrderedDict
+from dataclasses import asdict, fields
+from typing import Dict, Optional
+from ..models.business_scenario import BusinessScenario, SimulationResult
+
+# Campos de SimulationResult que se guardan como arrays en disco
+ARRAY_FIELDS = ('net_present_values', 'roi_values', 'break_even_months', 'weights')
+
+class ResultCache:
+    """Caché de resultados de simulación direccionada por contenido
+
+    Nivel 1: LRU en memoria acotado por bytes de los arrays. Nivel 2 (opcional):
+    un archivo .npz por clave en directory, que pueden compartir varios procesos
+    (p. ej. workers de gunicorn); se escribe en un temporal y se renombra, así
+    ningún lector ve un archivo a medias. Los resultados devueltos se comparten
+    entre llamadas y deben tratarse como de solo lectura.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, directory: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[str, SimulationResult]' = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(scenario: BusinessScenario, n_simulations: int, seed: int, options: Dict) -> str:
+        """Hash SHA-256 de los parámetros del escenario, la semilla y la configuración del motor
+
+        Los números del escenario y de las opciones se comparan como float (50000 y
+        50000.0 dan la misma clave); la semilla y el tamaño se conservan como enteros.
+        """
+        payload = {'scenario': _canonical(asdict(scenario)), 'n_simulations': int(n_simulations),
+                   'seed': None if seed is None else int(seed), 'options': _canonical(options)}
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, key: str) -> Optional[SimulationResult]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+
+        result = self._load(key) if self.directory else None
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._insert(key, result)
+        return result
+
+    def put(self, key: str, result: SimulationResult):
+        with self._lock:
+            self._insert(key, result)
+        if self.directory:
+            try:
+                self._store(key, result)
+            except OSError as e:
+                print(f"⚠️ No se pudo escribir la caché en disco: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.current_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _insert(self, key: str, result: SimulationResult):
+        """Inserta o refresca una entrada y expulsa las menos usadas si se supera max_bytes"""
+        size = _result_nbytes(result)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self.current_bytes -= self._sizes[key]
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        self._sizes[key] = size
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            evicted, _ = self._entries.popitem(last=False)
+            self.current_bytes -= self._sizes.pop(evicted)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def _store(self, key: str, result: SimulationResult):
+        """Escribe el resultado como .npz de forma atómica (temporal + os.replace)"""
+        arrays = {name: getattr(result, name) for name in ARRAY_FIELDS if getattr(result, name) is not None}
+        scalars = {f.name: _to_builtin(getattr(result, f.name)) for f in fields(result)
+                   if f.name not in ARRAY_FIELDS and f.name != 'risk_metrics'}
+        if result.risk_metrics is not None:
+            scalars['risk_metrics'] = {name: _to_builtin(value) for name, value in result.risk_metrics.items()}
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                np.savez(handle, metadata=np.array(json.dumps(scalars)), **arrays)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _load(self, key: str) -> Optional[SimulationResult]:
+        try:
+            with np.load(self._path(key), allow_pickle=False) as data:
+                scalars = json.loads(str(data['metadata']))
+                arrays = {name: data[name] for name in ARRAY_FIELDS if name in data.files}
+        except (OSError, ValueError, KeyError):
+            return None
+        return SimulationResult(**scalars, **arrays)
+
+
+def _result_nbytes(result: SimulationResult) -> int:
+    return sum(getattr(result, name).nbytes for name in ARRAY_FIELDS if getattr(result, name) is not None)
+
+
+def _to_builtin(value):
+    """Convierte escalares de numpy a tipos de Python para serializarlos en JSON"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _canonical(value):
+    """Copia con los números como float (sin -0.0) y los booleanos y numpy como tipos de Python"""
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value) + 0.0
+    return value
+
+
+_default_cache: Optional[ResultCache] = None
+
+def default_cache() -> ResultCache:
+    """Caché compartida del proceso; RESULT_CACHE_DIR activa el nivel en disco"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResultCache(directory=os.getenv('RESULT_CACHE_DIR'))
+    return _default_cache
+
@@ -0,0 +1,231 @@
+import uuid
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+from ..models.business_scenario import BusinessScenario, SimulationResult
+from ..utils.online_stats import StreamingAggregator
+from .monte_carlo_engine import MonteCarloEngine
+
+JOB_STATES = ('pending', 'running', 'done', 'cancelled', 'error')
+FINAL_STATES = ('done', 'cancelled', 'error')
+
+class JobCancelled(Exception):
+    """Interrumpe una simulación cuyo trabajo fue cancelado"""
+
+
+@dataclass
+class JobStatus:
+    """Estado de un trabajo de simulación en segundo plano"""
+    job_id: str
+    state: str
+    completed: int
+    total: int
+    result: Optional[SimulationResult] = None
+    error: Optional[str] = None
+    # Estimaciones parciales mientras corre (StreamingAggregator.snapshot)
+    partial: Optional[Dict] = None
+
+    @property
+    def done(self) -> bool:
+        return self.state in FINAL_STATES
+
+    @property
+    def fraction(self) -> float:
+        return self.completed / self.total if self.total else 1.0
+
+
+class _Job:
+    def __init__(self, job_id: str, scenario: BusinessScenario, total: int,
+                 on_complete: Optional[Callable[[SimulationResult], None]]):
+        self.job_id = job_id
+        self.scenario = scenario
+        self.total = total
+        self.on_complete = on_complete
+        self.future: Optional[Future] = None
+        self.state = 'pending'
+        self.result: Optional[SimulationResult] = None
+        self.error: Optional[str] = None
+
+
+class SimulationJobManager:
+    """Trabajos de simulación en procesos aparte, con avance parcial, cancelación y caché"""
+
+    # Bloques de los procesos de trabajo: al menos progress_block trayectorias y
+    # a lo sumo progress_updates publicaciones de avance por trabajo
+    progress_block = 2000
+    progress_updates = 50
+    histogram_bins = 50
+
+    def __init__(self, engine: MonteCarloEngine, max_workers: Optional[int] = None, max_jobs: int = 200):
+        self.engine = engine
+        self.max_workers = max_workers
+        self.max_jobs = max_jobs
+        self._jobs: 'OrderedDict[str, _Job]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._progress = None
+        self._cancelled = None
+        # Persistencia y on_complete de los trabajos terminados, fuera del hilo del pool
+        self._completer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='job-complete')
+
+    def submit(self, scenario: BusinessScenario, seed: Optional[int] = None,
+               on_complete: Optional[Callable[[SimulationResult], None]] = None) -> str:
+        """Encola la simulación de un escenario y devuelve el id del trabajo
+
+        on_complete(result) se ejecuta en este proceso cuando la simulación termina.
+        """
+        engine = self.engine
+        job = _Job(uuid.uuid4().hex, scenario, engine.n_simulations, on_complete)
+        # Con caché el resultado depende solo de los parámetros (ver simulate_scenario);
+        # sin ella cada trabajo toma una semilla nueva del flujo del motor
+        if seed is None:
+            seed = engine.seed if engine.cache is not None else int(engine.rng.integers(2**63))
+        cache_key = engine._cache_key(scenario, seed) if self._cacheable() else None
+
+        cached = engine.cache.get(cache_key) if cache_key else None
+        with self._lock:
+            self._register(job)
+            if cached is not None:
+                self._finish(job, cached)
+                return job.job_id
+
+            self._start()
+            job.future = self._executor.submit(_run_job, job.job_id, scenario, engine.n_simulations, seed,
+                                               engine._worker_options(), self._block_size(),
+                                               self.histogram_bins, self._progress, self._cancelled)
+        job.future.add_done_callback(lambda future: self._on_done(job, future, cache_key))
+        return job.job_id
+
+    def status(self, job_id: str) -> Optional[JobStatus]:
+        """Estado y avance del trabajo, o None si el id no existe (o ya fue descartado)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            state = job.state
+            completed = job.total if state == 'done' else 0
+        partial = None
+        if state in ('pending', 'running'):
+            partial = self._progress.get(job_id)
+            completed = partial['completed'] if partial else 0
+            state = 'running' if completed or job.future.running() else 'pending'
+        return JobStatus(job_id, state, completed, job.total, job.result, job.error, partial)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancela un trabajo pendiente o en curso; False si ya había terminado"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINAL_STATES:
+                return False
+            self._cancelled[job_id] = True
+        job.future.cancel()
+        return True
+
+    def shutdown(self):
+        """Cancela lo pendiente y detiene el pool y el Manager"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._manager.shutdown()
+            self._executor = None
+        self._completer.shutdown(wait=True)
+
+    def _block_size(self) -> int:
+        # Tamaño par: con pares antitéticos el resultado no depende del tamaño de bloque
+        size = max(self.progress_block, self.engine.n_simulations // self.progress_updates)
+        return min(self.engine.batch_size, size + size % 2)
+
+    def _cacheable(self) -> bool:
+        # Los trabajos simulan en un solo proceso; con workers > 1 la clave no coincidiría
+        return self.engine.cache is not None and self.engine.workers == 1
+
+    def _start(self):
+        if self._executor is None:
+            # Sin fork: se arranca desde hilos del servidor y podría heredar un lock tomado
+            # (forkserver no existe en Windows: allí se usa spawn)
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            context = multiprocessing.get_context(method)
+            self._manager = context.Manager()
+            self._progress = self._manager.dict()
+            self._cancelled = self._manager.dict()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+
+    def _register(self, job: _Job):
+        """Agrega un trabajo descartando los terminados más antiguos si se supera max_jobs"""
+        self._jobs[job.job_id] = job
+        if len(self._jobs) > self.max_jobs:
+            for job_id in [key for key, old in self._jobs.items() if old.state in FINAL_STATES]:
+                del self._jobs[job_id]
+                if len(self._jobs) <= self.max_jobs:
+                    break
+
+    def _finish(self, job: _Job, result: SimulationResult):
+        job.result = result
+        job.state = 'done'
+
+    def _on_done(self, job: _Job, future: Future, cache_key: Optional[str]):
+        try:
+            result = future.result()
+        except (CancelledError, JobCancelled):
+            with self._lock:
+                job.state = 'cancelled'
+        except Exception as e:
+            with self._lock:
+                job.error = str(e)
+                job.state = 'error'
+        else:
+            with self._lock:
+                self._finish(job, result)
+            if cache_key:
+                self.engine.cache.put(cache_key, result)
+            self._completer.submit(self._complete, job, result)
+        finally:
+            if self._progress is not None:
+                try:
+                    self._progress.pop(job.job_id, None)
+                    self._cancelled.pop(job.job_id, None)
+                except (EOFError, OSError):  # Manager ya detenido
+                    pass
+
+
+    def _complete(self, job: _Job, result: SimulationResult):
+        """Persiste el resultado y ejecuta on_complete; un error no afecta al trabajo"""
+        try:
+            self.engine._persist(job.scenario, result)
+        except Exception as e:
+            print(f"⚠️ Error guardando el trabajo {job.job_id}: {e}")
+        if job.on_complete is not None:
+            try:
+                job.on_complete(result)
+            except Exception as e:
+                print(f"⚠️ Error al completar el trabajo {job.job_id}: {e}")
+
+
+def _run_job(job_id: str, scenario: BusinessScenario, n_simulations: int, seed: Optional[int],
+             options: Dict, block_size: int, histogram_bins: int, progress, cancelled) -> SimulationResult:
+    """Simula un escenario dentro de un proceso del pool publicando avance y estimaciones parciales"""
+    # Siempre en un solo proceso (workers=1 por defecto): ya corre dentro del pool
+    engine = MonteCarloEngine(n_simulations=n_simulations, use_database=False, **options)
+    engine.batch_size = block_size
+    # Con muestreo por importancia las trayectorias no son muestras de la distribución
+    # original: solo se publica el avance, no estimaciones sin ponderar
+    aggregator = None if engine.tail_tilt else StreamingAggregator(
+        n_simulations, scenario.time_horizon, histogram_bins=histogram_bins)
+    completed = 0
+
+    def report(block):
+        nonlocal completed
+        if cancelled.get(job_id):
+            raise JobCancelled(job_id)
+        completed += len(block[0])
+        if aggregator is None:
+            progress[job_id] = {'completed': completed, 'total': n_simulations}
+        else:
+            aggregator.update(*block[:3])
+            progress[job_id] = aggregator.snapshot()
+
+    engine.progress_callback = report
+    return engine.simulate_scenario(scenario, seed=seed)
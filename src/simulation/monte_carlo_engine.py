@@ -1,101 +1,666 @@
+import os
+import math
 import numpy as np
-from typing import Tuple
-from ..models.business_scenario import BusinessScenario, SimulationResult
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import replace
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from ..models.business_scenario import BusinessScenario, ScenarioBatch, SimulationResult, SimulationProgress
 from ..database.neon_db import NeonDB
+from ..database.write_queue import WriteBehindQueue
 from ..utils.statistics import StatisticsCalculator
+from ..utils.online_stats import RunningMoments, StreamingAggregator
+from .samplers import make_sampler
+from .cache import ResultCache
+
+# Parámetros fijos del modelo financiero
+DISCOUNT_RATE = 0.1      # Tasa de descuento anual
+GROWTH_RATE = 0.02       # Crecimiento mensual lineal de ingresos
+INFLATION_STD = 0.01     # Volatilidad de los shocks de inflación
+INFLATION_MODELS = ('linear', 'compound')
+
+# Versión del modelo de simulación: cambiarla invalida los resultados en caché
+ENGINE_VERSION = '1'
+
+# Generadores de bits soportados para el Generator de cada motor
+BIT_GENERATORS = {
+    'PCG64': np.random.PCG64,
+    'PCG64DXSM': np.random.PCG64DXSM,
+    'Philox': np.random.Philox,
+    'SFC64': np.random.SFC64,
+}
 
 class MonteCarloEngine:
     """Motor de simulación Monte Carlo para decisiones empresariales"""
-    
-    def __init__(self, n_simulations: int = 10000, use_database: bool = True):
+
+    # Trayectorias simuladas por bloque vectorizado (acota la memoria de las matrices n×T)
+    batch_size = 50000
+
+    def __init__(self, n_simulations: int = 10000, use_database: bool = True,
+                 inflation_model: str = 'linear', workers: Optional[int] = 1, seed: int = 42,
+                 bit_generator: str = 'PCG64', antithetic: bool = False, control_variate: bool = False,
+                 sampler='pseudo', qmc_replicates: int = 1, tail_tilt: float = 0.0,
+                 cache: Optional[ResultCache] = None, async_writes: bool = False):
+        if inflation_model not in INFLATION_MODELS:
+            raise ValueError(f"Modelo de inflación no soportado: {inflation_model}")
+        if bit_generator not in BIT_GENERATORS:
+            raise ValueError(f"Generador de bits no soportado: {bit_generator}")
+        if tail_tilt and (antithetic or control_variate or qmc_replicates > 1):
+            raise ValueError("El muestreo por importancia no se combina con otras técnicas de reducción de varianza")
         self.n_simulations = n_simulations
         self.use_database = use_database
+        self.inflation_model = inflation_model
+        # workers=None usa todos los núcleos disponibles
+        self.workers = max(1, workers if workers is not None else (os.cpu_count() or 1))
+        self.seed = seed
+        self.bit_generator = bit_generator
+        # Reducción de varianza opcional: pares antitéticos y variable de control analítica
+        self.antithetic = antithetic
+        self.control_variate = control_variate
+        # Origen de las normales: 'pseudo', 'sobol' (QMC aleatorizado) o un muestreador propio
+        self.sampler = make_sampler(sampler, replicates=qmc_replicates)
+        # Muestreo por importancia: desplaza las normales de ingresos y mercado hacia pérdidas
+        self.tail_tilt = tail_tilt
+        # Caché opcional de resultados por parámetros del escenario y semilla
+        self.cache = cache
+        # Se invoca con las salidas de cada bloque simulado (NPV, ROI, break-even y,
+        # si aplican, control y pesos) para agregados parciales; si lanza una
+        # excepción la simulación se interrumpe (p. ej. al cancelar un trabajo)
+        self.progress_callback: Optional[Callable[[Tuple[np.ndarray, ...]], None]] = None
+        # Cada ejecución paralela genera flujos independientes a partir de esta secuencia
+        self._seed_sequence = np.random.SeedSequence(seed)
+        # Generator propio del motor: no comparte estado con np.random ni con otros motores
+        self.rng = self._make_rng(self._seed_sequence)
+        # Con async_writes el guardado en base de datos se hace en segundo plano
+        self.writer: Optional[WriteBehindQueue] = None
         if use_database:
+            # Sin conexión aquí: NeonDB conecta y migra el esquema en el primer guardado
             try:
                 self.db = NeonDB()
-                self.db.create_tables()
+                if async_writes:
+                    self.writer = WriteBehindQueue(self.db)
             except Exception as e:
                 print(f"⚠️ No se pudo conectar a la base de datos: {e}")
                 self.use_database = False
-        np.random.seed(42)
-    
-    def simulate_scenario(self, scenario: BusinessScenario) -> SimulationResult:
-        """Ejecuta simulación Monte Carlo para un escenario de negocio"""
-        
-        # Arrays para almacenar resultados
-        npv_values = np.zeros(self.n_simulations)
-        roi_values = np.zeros(self.n_simulations)
-        break_even_months = np.zeros(self.n_simulations)
-        
-        for i in range(self.n_simulations):
-            # Generar variables aleatorias
-            monthly_revenues = self._generate_revenue_series(scenario)
-            monthly_costs = self._generate_cost_series(scenario)
-            inflation_factors = self._generate_inflation_factors(scenario)
-            
-            # Calcular flujos de caja descontados
-            cash_flows = (monthly_revenues - monthly_costs) * inflation_factors
-            
-            # NPV usando integración Monte Carlo: ∫ CF(t) * e^(-r*t) dt
-            discount_rates = np.array([1/(1+0.1)**(t/12) for t in range(scenario.time_horizon)])
-            npv = np.sum(cash_flows * discount_rates) - scenario.initial_investment
-            
-            # ROI
-            total_profit = np.sum(cash_flows)
-            roi = (total_profit / scenario.initial_investment) * 100 if scenario.initial_investment > 0 else 0
-            
-            # Break-even
-            cumulative_cash = np.cumsum(cash_flows) - scenario.initial_investment
-            break_even = np.argmax(cumulative_cash > 0) + 1 if np.any(cumulative_cash > 0) else scenario.time_horizon
-            
-            npv_values[i] = npv
-            roi_values[i] = roi
-            break_even_months[i] = break_even
-        
-        result = self._calculate_statistics(scenario.name, npv_values, roi_values, break_even_months)
-        
-        # Guardar en base de datos si está habilitada
+
+    def simulate_scenario(self, scenario: BusinessScenario, seed: Optional[int] = None) -> SimulationResult:
+        """Ejecuta simulación Monte Carlo para un escenario de negocio
+
+        Sin seed la simulación continúa el flujo aleatorio del motor; con seed se
+        usa un flujo nuevo y reproducible solo para esta llamada. Con caché, una
+        llamada sin seed usa la semilla del motor, de modo que el resultado depende
+        solo de los parámetros y las repeticiones se sirven desde la caché sin
+        volver a simular ni guardar en base de datos.
+        """
+
+        if self.cache is not None:
+            seed = self.seed if seed is None else seed
+            cache_key = self._cache_key(scenario, seed)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        seed_sequence = np.random.SeedSequence(seed) if seed is not None else None
+        if self.workers > 1:
+            arrays, chunk_sizes = self._simulate_parallel(scenario, seed_sequence)
+        else:
+            rng = self._make_rng(seed_sequence) if seed_sequence is not None else self.rng
+            arrays = self._simulate_replicates(scenario, self.n_simulations, rng)
+            chunk_sizes = [self.n_simulations]
+
+        npv_values, roi_values, break_even_months = arrays[:3]
+        weights = arrays[-1] if self.tail_tilt else None
+        result = self._calculate_statistics(scenario.name, npv_values, roi_values, break_even_months, weights)
+        if self.antithetic or self.control_variate or self.sampler.replicates > 1:
+            control_values = arrays[3] if self.control_variate else None
+            # Los bloques de cada proceso no son réplicas: sin réplicas QMC se estima
+            # con todas las trayectorias (o pares) juntas
+            replicate_sizes = None
+            if self.sampler.replicates > 1:
+                replicate_sizes = [size for chunk in chunk_sizes for size in self._split(chunk, self.sampler.replicates)]
+            self._apply_variance_reduction(scenario, result, control_values, replicate_sizes)
+        self._persist(scenario, result)
+        if self.cache is not None:
+            self.cache.put(cache_key, result)
+        return result
+
+    def simulate_many(self, scenarios: List[BusinessScenario], common_random_numbers: bool = False,
+                      seed: Optional[int] = None) -> List[SimulationResult]:
+        """Simula varios escenarios en pasadas vectorizadas sobre un tensor (escenario, trayectoria, mes)
+
+        Los escenarios con el mismo horizonte se apilan en un ScenarioBatch y se
+        evalúan juntos, por bloques que respetan batch_size. Con
+        common_random_numbers todos comparten las mismas normales, lo que reduce el
+        ruido al compararlos; con seed, además, cada grupo de horizonte parte de
+        la semilla y usa las mismas normales que simulate_scenario(scenario, seed).
+        Se aplican el muestreador y los pares antitéticos; la variable de control y
+        el muestreo por importancia quedan para simulate_scenario. Devuelve los
+        resultados en el orden recibido.
+        """
+        rng = self._make_rng(np.random.SeedSequence(seed)) if seed is not None else self.rng
+        results: List[Optional[SimulationResult]] = [None] * len(scenarios)
+
+        by_horizon: Dict[int, List[int]] = {}
+        for index, scenario in enumerate(scenarios):
+            by_horizon.setdefault(scenario.time_horizon, []).append(index)
+
+        for time_horizon, indices in by_horizon.items():
+            if common_random_numbers and seed is not None:
+                rng = self._make_rng(np.random.SeedSequence(seed))
+            arrays = self._simulate_stacked([scenarios[i] for i in indices], rng, common_random_numbers)
+            for position, index in enumerate(indices):
+                result = self._calculate_statistics(scenarios[index].name, *(values[position] for values in arrays))
+                if self.antithetic:
+                    self._apply_variance_reduction(scenarios[index], result)
+                results[index] = result
+
+        self._persist_many(scenarios, results)
+        return results
+
+    def _simulate_stacked(self, scenarios: List[BusinessScenario], rng,
+                          common_random_numbers: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Simula escenarios de igual horizonte y devuelve arrays (escenarios, trayectorias)"""
+        n_paths = self.n_simulations
+        time_horizon = scenarios[0].time_horizon
+        outputs = tuple(np.empty((len(scenarios), n_paths)) for _ in range(3))
+        # Bloques de escenarios × trayectorias con a lo sumo batch_size trayectorias en total
+        paths_per_block = min(n_paths, self.batch_size)
+        scenarios_per_block = max(1, self.batch_size // paths_per_block)
+        batches = [(first, ScenarioBatch.from_scenarios(scenarios[first:first + scenarios_per_block]))
+                   for first in range(0, len(scenarios), scenarios_per_block)]
+        # Un flujo común o uno por escenario, creados una sola vez para todo el grupo
+        n_streams = 1 if common_random_numbers else len(scenarios)
+        streams = [self.sampler.stream(rng, n_paths, 4 * time_horizon) for _ in range(n_streams)]
+
+        # Bloques de trayectorias por fuera: con números comunes cada bloque de
+        # normales se extrae una vez y se reutiliza en todos los bloques de escenarios
+        for start in range(0, n_paths, paths_per_block):
+            stop = min(start + paths_per_block, n_paths)
+            if common_random_numbers:
+                common = self._draw_normals(streams[0], stop - start, time_horizon)[np.newaxis]
+            for first, batch in batches:
+                count = len(batch.names)
+                normals = common if common_random_numbers else np.stack(
+                    [self._draw_normals(stream, stop - start, time_horizon)
+                     for stream in streams[first:first + count]])
+                for output, values in zip(outputs, self._evaluate_paths(batch, normals)):
+                    output[first:first + count, start:stop] = values
+
+        return outputs
+
+    def summarize_common(self, scenarios: List[BusinessScenario], seed: Optional[int] = None,
+                         time_horizon: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """NPV medio y probabilidad de éxito (%) de cada escenario sobre las mismas normales, sin persistir"""
+        rng = self._make_rng(np.random.SeedSequence(seed)) if seed is not None else self.rng
+        n_paths = self.n_simulations
+        # Normales del horizonte más largo (o time_horizon): los menores usan sus primeros meses
+        max_horizon = max([time_horizon or 0] + [scenario.time_horizon for scenario in scenarios])
+        stream = self.sampler.stream(rng, n_paths, 4 * max_horizon)
+        paths_per_block = min(n_paths, self.batch_size)
+        scenarios_per_block = max(1, self.batch_size // paths_per_block)
+
+        by_horizon: Dict[int, List[int]] = {}
+        for index, scenario in enumerate(scenarios):
+            by_horizon.setdefault(scenario.time_horizon, []).append(index)
+        batches = [(horizon, indices[first:first + scenarios_per_block],
+                    ScenarioBatch.from_scenarios([scenarios[i] for i in indices[first:first + scenarios_per_block]]))
+                   for horizon, indices in by_horizon.items()
+                   for first in range(0, len(indices), scenarios_per_block)]
+
+        npv_sums = np.zeros(len(scenarios))
+        successes = np.zeros(len(scenarios))
+        for start in range(0, n_paths, paths_per_block):
+            common = self._draw_normals(stream, min(paths_per_block, n_paths - start), max_horizon)[np.newaxis]
+            for horizon, block, batch in batches:
+                npv_values = self._evaluate_paths(batch, common[..., :horizon])[0]
+                npv_sums[block] += npv_values.sum(axis=1)
+                successes[block] += np.count_nonzero(npv_values > 0, axis=1)
+
+        return npv_sums / n_paths, successes / n_paths * 100
+
+    def evaluate_parameter_sets(self, base_scenario: BusinessScenario, parameter_sets: List[Dict],
+                                seed: Optional[int] = None, chunk_size: int = 256,
+                                progress_callback: Optional[Callable[[int, int], None]] = None
+                                ) -> Tuple[np.ndarray, np.ndarray]:
+        """Evalúa muchas variantes del escenario base sobre las mismas normales
+
+        Cada elemento de parameter_sets sobrescribe campos del escenario base. Las
+        variantes se reparten en bloques de chunk_size entre los procesos del motor
+        (workers); cada bloque regenera las normales comunes a partir de seed con
+        summarize_common y progress_callback(completadas, total) se invoca al
+        terminar. Devuelve el NPV medio y la probabilidad de éxito (%) de cada variante.
+        """
+        # Todos los bloques (y procesos) deben extraer las mismas normales
+        seed = int(self.rng.integers(2**63)) if seed is None else seed
+        time_horizon = max([base_scenario.time_horizon] +
+                           [parameters.get('time_horizon', 0) for parameters in parameter_sets])
+        total = len(parameter_sets)
+        npv_means = np.empty(total)
+        success_probs = np.empty(total)
+        bounds = [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+        completed = 0
+
+        def store(start, stop, values):
+            nonlocal completed
+            npv_means[start:stop], success_probs[start:stop] = values
+            completed += stop - start
+            if progress_callback:
+                progress_callback(completed, total)
+
+        if self.workers > 1:
+            options = self._worker_options()
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(_evaluate_parameter_chunk, base_scenario, parameter_sets[start:stop],
+                                       seed, time_horizon, self.n_simulations, self.batch_size, options): (start, stop)
+                           for start, stop in bounds}
+                for future in as_completed(futures):
+                    store(*futures[future], future.result())
+        else:
+            for start, stop in bounds:
+                scenarios = [replace(base_scenario, **parameters) for parameters in parameter_sets[start:stop]]
+                store(start, stop, self.summarize_common(scenarios, seed, time_horizon))
+
+        return npv_means, success_probs
+
+    def analytic_expected_npv(self, scenario: BusinessScenario) -> float:
+        """NPV esperado implícito en las medias del escenario (sin truncar ingresos ni costos)"""
+        months = np.arange(scenario.time_horizon)
+        expected_cash = scenario.revenue_mean * (1 + GROWTH_RATE * months) - scenario.cost_mean
+        return float(np.sum(expected_cash * self._expected_inflation_factors(scenario)
+                            * self._discount_factors(scenario.time_horizon)) - scenario.initial_investment)
+
+    def simulate_streaming(self, scenario: BusinessScenario, chunk_size: int = 100000,
+                           keep_arrays: bool = False, seed: Optional[int] = None) -> Iterator[SimulationProgress]:
+        """Simula por bloques con memoria acotada y entrega el resultado parcial tras cada bloque"""
+        rng = self._make_rng(np.random.SeedSequence(seed)) if seed is not None else self.rng
+        aggregator = StreamingAggregator(self.n_simulations, scenario.time_horizon)
+        chunks = []
+
+        for start in range(0, self.n_simulations, chunk_size):
+            n_paths = min(chunk_size, self.n_simulations - start)
+            arrays = self._simulate_paths(scenario, n_paths, rng)
+            aggregator.update(*arrays)
+            if keep_arrays:
+                chunks.append(arrays)
+
+            if aggregator.count < self.n_simulations:
+                yield SimulationProgress(aggregator.count, self.n_simulations,
+                                         self._aggregate_result(scenario.name, aggregator, partial=True))
+
+        if keep_arrays:
+            result = self._calculate_statistics(scenario.name, *(np.concatenate(arrays) for arrays in zip(*chunks)))
+        else:
+            result = self._aggregate_result(scenario.name, aggregator)
+        self._persist(scenario, result)
+        yield SimulationProgress(aggregator.count, self.n_simulations, result)
+
+    def simulate_adaptive(self, scenario: BusinessScenario, npv_tolerance: Optional[float] = None,
+                          success_tolerance: Optional[float] = None, batch_size: int = 2000,
+                          max_simulations: int = 1000000, seed: Optional[int] = None) -> SimulationResult:
+        """Simula por lotes hasta alcanzar la precisión pedida
+
+        Se detiene cuando el error estándar de mean_npv es menor que npv_tolerance
+        (en $) y el de success_probability menor que success_tolerance (en puntos
+        porcentuales), o al llegar a max_simulations. La precisión alcanzada queda
+        en std_error_npv y std_error_success del resultado.
+        """
+        if npv_tolerance is None and success_tolerance is None:
+            raise ValueError("Debe indicar npv_tolerance o success_tolerance")
+
+        rng = self._make_rng(np.random.SeedSequence(seed)) if seed is not None else self.rng
+        moments = RunningMoments()
+        successes = 0
+        chunks = []
+
+        while moments.count < max_simulations:
+            n_paths = min(batch_size, max_simulations - moments.count)
+            arrays = self._simulate_paths(scenario, n_paths, rng)
+            chunks.append(arrays)
+            moments.update(arrays[0])
+            successes += int(np.count_nonzero(arrays[0] > 0))
+
+            npv_ok = npv_tolerance is None or moments.std_error <= npv_tolerance
+            success_ok = (success_tolerance is None or
+                          self._success_std_error(successes, moments.count) <= success_tolerance)
+            if npv_ok and success_ok:
+                break
+
+        result = self._calculate_statistics(scenario.name, *(np.concatenate(arrays) for arrays in zip(*chunks)))
+        self._persist(scenario, result)
+        return result
+
+    @staticmethod
+    def _success_std_error(successes: int, n_paths: int) -> float:
+        """Error estándar de la probabilidad de éxito en puntos porcentuales
+
+        Usa la proporción suavizada (éxitos + 0.5) / (n + 1) para no declarar
+        precisión perfecta cuando todavía no se observó ningún éxito o fracaso.
+        """
+        p = (successes + 0.5) / (n_paths + 1)
+        return math.sqrt(p * (1 - p) / n_paths) * 100
+
+    def _apply_variance_reduction(self, scenario: BusinessScenario, result: SimulationResult,
+                                  control_values: Optional[np.ndarray] = None, replicate_sizes=None):
+        """Ajusta mean_npv y su error estándar según el diseño de muestreo (pares, control o réplicas QMC)"""
+        npv_values = result.net_present_values
+        plain_variance = npv_values.var() / len(npv_values)
+
+        # Los puntos de una réplica QMC no son independientes: el error sale de la dispersión entre réplicas
+        if replicate_sizes is not None and len(replicate_sizes) > 1:
+            bounds = np.cumsum([0] + list(replicate_sizes))
+            blocks = [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+            estimates = np.array([self._reduced_estimate(
+                scenario, npv_values[block], control_values[block] if control_values is not None else None)[0]
+                for block in blocks])
+            success_rates = np.array([np.mean(npv_values[block] > 0) * 100 for block in blocks])
+            estimate = estimates.mean()
+            estimator_variance = estimates.var(ddof=1) / len(estimates)
+            result.std_error_success = success_rates.std(ddof=1) / math.sqrt(len(success_rates))
+        else:
+            estimate, estimator_variance = self._reduced_estimate(scenario, npv_values, control_values)
+
+        result.mean_npv = estimate
+        result.std_error_npv = math.sqrt(estimator_variance)
+        result.variance_reduction_factor = plain_variance / estimator_variance if estimator_variance > 0 else float('inf')
+
+    def _reduced_estimate(self, scenario: BusinessScenario, npv_values: np.ndarray,
+                          control_values: Optional[np.ndarray] = None) -> Tuple[float, float]:
+        """Estimación de la media del NPV y su varianza con pares antitéticos y/o variable de control
+
+        Los pares antitéticos ocupan posiciones consecutivas (2k, 2k+1) y se promedian
+        antes de estimar. La variable de control usa el coeficiente óptimo
+        β = cov(NPV, C) / var(C) con E[C] = analytic_expected_npv.
+        """
+        samples = npv_values
+        controls = control_values
+        if self.antithetic:
+            n_pairs = len(npv_values) // 2
+            samples = npv_values[:2 * n_pairs].reshape(n_pairs, 2).mean(axis=1)
+            if controls is not None:
+                controls = controls[:2 * n_pairs].reshape(n_pairs, 2).mean(axis=1)
+
+        estimate = samples.mean()
+        residuals = samples
+        if controls is not None:
+            control_variance = controls.var()
+            if control_variance > 0:
+                beta = np.mean((samples - estimate) * (controls - controls.mean())) / control_variance
+                residuals = samples - beta * controls
+                estimate -= beta * (controls.mean() - self.analytic_expected_npv(scenario))
+
+        return estimate, residuals.var() / len(samples)
+
+    def _aggregate_result(self, name: str, aggregator: StreamingAggregator,
+                          partial: bool = False) -> SimulationResult:
+        """Construye un SimulationResult sin arrays a partir de los agregados en línea"""
+        empty = np.empty(0)
+        if partial:
+            # Los parciales estiman los percentiles con el t-digest y no traen risk_metrics:
+            # las colas exactas se ordenan una sola vez, para el resultado final
+            percentile_5, percentile_95 = (float(q) for q in aggregator.npv_digest.quantile([0.05, 0.95]))
+        else:
+            percentile_5, percentile_95 = aggregator.percentile_5(), aggregator.percentile_95()
+        return SimulationResult(
+            scenario_name=name,
+            net_present_values=empty,
+            roi_values=empty,
+            break_even_months=empty,
+            success_probability=aggregator.success_probability,
+            mean_npv=aggregator.npv.mean,
+            std_npv=aggregator.npv.std,
+            percentile_5=percentile_5,
+            percentile_95=percentile_95,
+            var_95=percentile_5,
+            std_error_npv=aggregator.npv.std_error,
+            std_error_success=self._success_std_error(aggregator.successes, aggregator.count),
+            risk_metrics=None if partial else aggregator.risk_metrics()
+        )
+
+    def _persist(self, scenario: BusinessScenario, result: SimulationResult):
+        """Guarda escenario y resultado en base de datos si está habilitada"""
         if self.use_database:
             try:
-                scenario_id = self.db.save_scenario(scenario)
                 metrics = StatisticsCalculator.calculate_risk_metrics(result)
-                self.db.save_simulation_result(scenario_id, result, metrics)
+                if self.writer is not None:
+                    self.writer.submit(scenario, result, metrics)
+                    return
+                self.db.save_run(scenario, result, metrics)
                 print(f"✅ Escenario '{scenario.name}' guardado en base de datos")
             except Exception as e:
                 print(f"⚠️ Error guardando en base de datos: {e}")
-        
-        return result
-    
-    def _generate_revenue_series(self, scenario: BusinessScenario) -> np.ndarray:
-        """Genera serie temporal de ingresos con tendencia y volatilidad"""
-        base_revenues = np.random.normal(scenario.revenue_mean, scenario.revenue_std, scenario.time_horizon)
+
+    def _persist_many(self, scenarios: List[BusinessScenario], results: List[SimulationResult]):
+        """Guarda varios escenarios y resultados en una sola transacción"""
+        if self.use_database:
+            try:
+                runs = [(scenario, result, StatisticsCalculator.calculate_risk_metrics(result))
+                        for scenario, result in zip(scenarios, results)]
+                if self.writer is not None:
+                    for run in runs:
+                        self.writer.submit(*run)
+                    return
+                self.db.save_runs(runs)
+                print(f"✅ {len(runs)} escenarios guardados en base de datos")
+            except Exception as e:
+                print(f"⚠️ Error guardando en base de datos: {e}")
+
+    def _cache_key(self, scenario: BusinessScenario, seed: int) -> str:
+        """Clave de caché: escenario, tamaño, semilla, versión del modelo y opciones del motor"""
+        options = {name: value for name, value in self._worker_options().items() if name != 'sampler'}
+        options.update(version=ENGINE_VERSION, workers=self.workers,
+                       sampler=type(self.sampler).__name__, replicates=self.sampler.replicates)
+        return ResultCache.make_key(scenario, self.n_simulations, seed, options)
+
+    def _make_rng(self, seed_sequence: np.random.SeedSequence) -> np.random.Generator:
+        """Crea un Generator con el generador de bits configurado"""
+        return np.random.Generator(BIT_GENERATORS[self.bit_generator](seed_sequence))
+
+    def _simulate_parallel(self, scenario: BusinessScenario,
+                           seed_sequence: Optional[np.random.SeedSequence] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Reparte las iteraciones entre procesos, cada uno con su propio Generator
+
+        Los flujos de cada proceso se derivan con SeedSequence.spawn, por lo que para
+        una semilla y un número de workers dados el resultado es idéntico bit a bit.
+        Devuelve los arrays unidos y el tamaño del bloque de cada proceso.
+        """
+        chunk_sizes = self._split(self.n_simulations, self.workers)
+        child_seeds = (seed_sequence or self._seed_sequence).spawn(self.workers)
+        options = self._worker_options()
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(_simulate_chunk, scenario, size, child_seed, options)
+                       for size, child_seed in zip(chunk_sizes, child_seeds) if size > 0]
+            chunks = [future.result() for future in futures]
+
+        return tuple(np.concatenate(arrays) for arrays in zip(*chunks)), chunk_sizes
+
+    def _split(self, n_paths: int, parts: int) -> list:
+        """Reparte n_paths en bloques casi iguales
+
+        Con pares antitéticos todos los bloques salvo el último tienen tamaño par,
+        para que ningún par quede partido entre bloques.
+        """
+        unit = 2 if self.antithetic else 1
+        base, extra = divmod(n_paths // unit, parts)
+        sizes = [(base + (1 if i < extra else 0)) * unit for i in range(parts)]
+        sizes[-1] += n_paths - sum(sizes)
+        return sizes
+
+    def _simulate_replicates(self, scenario: BusinessScenario, n_paths: int, rng) -> Tuple[np.ndarray, ...]:
+        """Simula n_paths trayectorias repartidas en las réplicas del muestreador
+
+        Cada réplica abre un flujo nuevo del muestreador (una aleatorización QMC
+        independiente); con muestreo pseudoaleatorio hay una sola réplica.
+        """
+        blocks = [self._simulate_paths(scenario, size, rng, with_control=self.control_variate,
+                                       with_weights=bool(self.tail_tilt))
+                  for size in self._split(n_paths, self.sampler.replicates) if size > 0]
+        if len(blocks) == 1:
+            return blocks[0]
+        return tuple(np.concatenate(arrays) for arrays in zip(*blocks))
+
+    def _worker_options(self) -> Dict:
+        """Opciones del motor que se replican en los procesos de trabajo"""
+        return {'inflation_model': self.inflation_model, 'bit_generator': self.bit_generator,
+                'antithetic': self.antithetic, 'control_variate': self.control_variate,
+                'sampler': self.sampler, 'tail_tilt': self.tail_tilt}
+
+    def _simulate_paths(self, scenario: BusinessScenario, n_paths: int, rng,
+                        with_control: bool = False, with_weights: bool = False) -> Tuple[np.ndarray, ...]:
+        """Simula n_paths trayectorias por bloques de matrices (trayectorias × meses)
+
+        Devuelve NPV, ROI y break-even; con with_control añade los valores de la
+        variable de control y con with_weights aplica el desplazamiento tail_tilt
+        y añade al final las razones de verosimilitud de cada trayectoria.
+        """
+        n_outputs = 3 + with_control + with_weights
+        outputs = tuple(np.empty(n_paths) for _ in range(n_outputs))
+        stream = self.sampler.stream(rng, n_paths, 4 * scenario.time_horizon)
+
+        for start in range(0, n_paths, self.batch_size):
+            stop = min(start + self.batch_size, n_paths)
+            normals = self._draw_normals(stream, stop - start, scenario.time_horizon)
+            log_weights = self._tilt_normals(normals) if with_weights else None
+            block = self._evaluate_paths(scenario, normals)
+            if with_control:
+                block += (self._control_values(scenario, normals),)
+            if with_weights:
+                block += (np.exp(log_weights),)
+            for output, values in zip(outputs, block):
+                output[start:stop] = values
+            if self.progress_callback is not None:
+                self.progress_callback(block)
+
+        return outputs
+
+    def _draw_normals(self, stream, n_paths: int, time_horizon: int) -> np.ndarray:
+        """Extrae las normales estándar de un bloque con forma (n_paths, 4, time_horizon)
+
+        El eje 1 recorre ingresos, shocks de mercado, costos e inflación. Las series
+        se obtienen luego con transformaciones afines (media + desviación * z), así
+        que basta con el standard_normal (ziggurat) del Generator o con las normales
+        QMC del muestreador. Con antithetic cada extracción z va seguida de su espejo -z.
+        """
+        if not self.antithetic:
+            return stream.normals(n_paths).reshape(n_paths, 4, time_horizon)
+
+        n_half = (n_paths + 1) // 2
+        half = stream.normals(n_half).reshape(n_half, 4, time_horizon)
+        normals = np.empty((2 * half.shape[0], 4, time_horizon))
+        normals[0::2] = half
+        normals[1::2] = -half
+        return normals[:n_paths]
+
+    def _tilt_normals(self, normals: np.ndarray) -> np.ndarray:
+        """Desplaza en -tail_tilt las normales de ingresos y shocks de mercado (en el sitio)
+
+        Devuelve el logaritmo de la razón de verosimilitud N(0,1)/N(-θ,1) de cada
+        trayectoria, log w = θ Σz - d θ² / 2, con z las normales sin desplazar y d
+        el número de normales desplazadas.
+        """
+        theta = self.tail_tilt
+        tilted = normals[:, :2, :]
+        log_weights = theta * tilted.sum(axis=(1, 2)) - tilted[0].size * theta**2 / 2
+        tilted -= theta
+        return log_weights
+
+    def _evaluate_paths(self, scenario: BusinessScenario, normals: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Calcula NPV, ROI y break-even de un bloque de trayectorias con operaciones de arrays
+
+        Los parámetros del escenario pueden ser escalares (un BusinessScenario) o
+        arrays con forma (escenarios, 1, 1) de un ScenarioBatch; en ese caso normals
+        tiene forma (escenarios, trayectorias, 4, meses) y todo se evalúa por broadcasting.
+        """
+        time_horizon = normals.shape[-1]
+        investment = np.asarray(scenario.initial_investment)
+
+        monthly_revenues = self._generate_revenue_series(scenario, normals[..., 0, :], normals[..., 1, :])
+        monthly_costs = self._generate_cost_series(scenario, normals[..., 2, :])
+        inflation_factors = self._generate_inflation_factors(scenario, normals[..., 3, :])
+
+        # Calcular flujos de caja descontados
+        cash_flows = (monthly_revenues - monthly_costs) * inflation_factors
+
+        # NPV usando integración Monte Carlo: ∫ CF(t) * e^(-r*t) dt
+        npv = (np.sum(cash_flows * self._discount_factors(time_horizon), axis=-1, keepdims=True) - investment)[..., 0]
+
+        # ROI (cero si no hay inversión inicial)
+        total_profit = np.sum(cash_flows, axis=-1, keepdims=True)
+        roi = np.where(investment > 0, total_profit / np.where(investment > 0, investment, 1) * 100, 0)[..., 0]
+
+        # Break-even: primer mes con caja acumulada positiva, o el horizonte completo
+        cumulative_cash = np.cumsum(cash_flows, axis=-1) - investment
+        positive = cumulative_cash > 0
+        break_even = np.where(positive.any(axis=-1), np.argmax(positive, axis=-1) + 1, time_horizon)
+
+        return npv, roi, break_even
+
+    def _control_values(self, scenario: BusinessScenario, normals: np.ndarray) -> np.ndarray:
+        """Variable de control por trayectoria con esperanza conocida (analytic_expected_npv)
+
+        Es el NPV de los flujos sin truncar en cero y con la inflación fijada en su
+        trayectoria media; está muy correlacionada con el NPV simulado.
+        """
+        time_horizon = normals.shape[-1]
+        growth_trend = 1 + GROWTH_RATE * np.arange(time_horizon)
+        revenues = ((scenario.revenue_mean + scenario.revenue_std * normals[..., 0, :]) * growth_trend
+                    * (1 + scenario.market_volatility * normals[..., 1, :]))
+        costs = scenario.cost_mean + scenario.cost_std * normals[..., 2, :]
+        weights = self._expected_inflation_factors(scenario) * self._discount_factors(time_horizon)
+        return np.sum((revenues - costs) * weights, axis=-1) - scenario.initial_investment
+
+    @staticmethod
+    def _discount_factors(time_horizon: int) -> np.ndarray:
+        """Factores de descuento mensuales a la tasa anual DISCOUNT_RATE"""
+        return 1 / (1 + DISCOUNT_RATE) ** (np.arange(time_horizon) / 12)
+
+    def _expected_inflation_factors(self, scenario: BusinessScenario) -> np.ndarray:
+        """Trayectoria de inflación sin shocks según el modelo de inflación del motor"""
+        months = np.arange(1, scenario.time_horizon + 1)
+        if self.inflation_model == 'compound':
+            return (1 + scenario.inflation_rate / 12) ** -months
+        return 1 - months * scenario.inflation_rate / 12
+
+    def _generate_revenue_series(self, scenario: BusinessScenario, revenue_normals: np.ndarray,
+                                 shock_normals: np.ndarray) -> np.ndarray:
+        """Genera series de ingresos con tendencia y volatilidad"""
+        base_revenues = scenario.revenue_mean + scenario.revenue_std * revenue_normals
         # Añadir tendencia de crecimiento
-        growth_trend = np.array([1 + 0.02 * t for t in range(scenario.time_horizon)])
+        growth_trend = 1 + GROWTH_RATE * np.arange(revenue_normals.shape[-1])
         # Añadir volatilidad del mercado
-        market_shocks = np.random.normal(1, scenario.market_volatility, scenario.time_horizon)
+        market_shocks = 1 + scenario.market_volatility * shock_normals
         return np.maximum(base_revenues * growth_trend * market_shocks, 0)
-    
-    def _generate_cost_series(self, scenario: BusinessScenario) -> np.ndarray:
-        """Genera serie temporal de costos con inflación"""
-        base_costs = np.random.normal(scenario.cost_mean, scenario.cost_std, scenario.time_horizon)
+
+    def _generate_cost_series(self, scenario: BusinessScenario, cost_normals: np.ndarray) -> np.ndarray:
+        """Genera series de costos"""
+        base_costs = scenario.cost_mean + scenario.cost_std * cost_normals
         return np.maximum(base_costs, 0)
-    
-    def _generate_inflation_factors(self, scenario: BusinessScenario) -> np.ndarray:
-        """Genera factores de inflación estocásticos"""
-        inflation_shocks = np.random.normal(scenario.inflation_rate, 0.01, scenario.time_horizon)
-        return np.array([1 - sum(inflation_shocks[:t+1])/12 for t in range(scenario.time_horizon)])
-    
-    def _calculate_statistics(self, name: str, npv_values: np.ndarray, 
-                            roi_values: np.ndarray, break_even_months: np.ndarray) -> SimulationResult:
+
+    def _generate_inflation_factors(self, scenario: BusinessScenario, inflation_normals: np.ndarray) -> np.ndarray:
+        """Genera factores de inflación estocásticos para un bloque de trayectorias
+
+        'linear' descuenta la inflación acumulada de forma aditiva (1 - Σπ/12) y
+        'compound' la capitaliza mes a mes (Π 1/(1 + π/12)). Ambos son O(T) por
+        trayectoria gracias a la suma acumulada sobre el eje de meses.
+        """
+        inflation_shocks = scenario.inflation_rate + INFLATION_STD * inflation_normals
+        if self.inflation_model == 'compound':
+            return np.exp(-np.cumsum(np.log1p(inflation_shocks / 12), axis=-1))
+        return 1 - np.cumsum(inflation_shocks, axis=-1) / 12
+
+    def _calculate_statistics(self, name: str, npv_values: np.ndarray,
+                            roi_values: np.ndarray, break_even_months: np.ndarray,
+                            weights: Optional[np.ndarray] = None) -> SimulationResult:
         """Calcula estadísticas del resultado de simulación"""
-        
+
+        if weights is not None:
+            return self._calculate_weighted_statistics(name, npv_values, roi_values, break_even_months, weights)
+
         success_probability = np.mean(npv_values > 0) * 100
         mean_npv = np.mean(npv_values)
         std_npv = np.std(npv_values)
-        percentile_5 = np.percentile(npv_values, 5)
-        percentile_95 = np.percentile(npv_values, 95)
-        var_95 = np.percentile(npv_values, 5)  # Value at Risk
-        
+        percentile_5, percentile_95 = np.percentile(npv_values, [5, 95])
+        var_95 = percentile_5  # Value at Risk
+
         return SimulationResult(
             scenario_name=name,
             net_present_values=npv_values,
@@ -106,5 +671,56 @@ class MonteCarloEngine:
             std_npv=std_npv,
             percentile_5=percentile_5,
             percentile_95=percentile_95,
-            var_95=var_95
-        )
\ No newline at end of file
+            var_95=var_95,
+            std_error_npv=std_npv / math.sqrt(len(npv_values)),
+            std_error_success=self._success_std_error(int(np.count_nonzero(npv_values > 0)), len(npv_values))
+        )
+
+    def _calculate_weighted_statistics(self, name: str, npv_values: np.ndarray, roi_values: np.ndarray,
+                                       break_even_months: np.ndarray, weights: np.ndarray) -> SimulationResult:
+        """Estadísticas autonormalizadas con las razones de verosimilitud del muestreo por importancia"""
+        normalized = weights / weights.sum()
+        mean_npv = np.sum(normalized * npv_values)
+        std_npv = np.sqrt(np.sum(normalized * (npv_values - mean_npv)**2))
+        percentile_5, percentile_95 = StatisticsCalculator.weighted_quantile(npv_values, normalized, [0.05, 0.95])
+        success = npv_values > 0
+        success_probability = np.sum(normalized[success]) * 100
+
+        # Errores estándar del estimador de razón (método delta)
+        n_paths = len(npv_values)
+        std_error_npv = np.sqrt(np.sum((normalized * (npv_values - mean_npv))**2))
+        std_error_success = np.sqrt(np.sum((normalized * (success - success_probability / 100))**2)) * 100
+
+        return SimulationResult(
+            scenario_name=name,
+            net_present_values=npv_values,
+            roi_values=roi_values,
+            break_even_months=break_even_months,
+            success_probability=success_probability,
+            mean_npv=mean_npv,
+            std_npv=std_npv,
+            percentile_5=percentile_5,
+            percentile_95=percentile_95,
+            var_95=percentile_5,
+            std_error_npv=std_error_npv,
+            std_error_success=std_error_success,
+            variance_reduction_factor=(std_npv**2 / n_paths) / std_error_npv**2 if std_error_npv > 0 else None,
+            weights=weights
+        )
+
+
+def _simulate_chunk(scenario: BusinessScenario, n_paths: int, seed_sequence: np.random.SeedSequence,
+                    options: Dict) -> Tuple[np.ndarray, ...]:
+    """Simula un bloque de trayectorias dentro de un proceso de trabajo"""
+    engine = MonteCarloEngine(n_simulations=n_paths, use_database=False, **options)
+    return engine._simulate_replicates(scenario, n_paths, engine._make_rng(seed_sequence))
+
+
+def _evaluate_parameter_chunk(base_scenario: BusinessScenario, parameter_sets: List[Dict], seed: int,
+                              time_horizon: int, n_simulations: int, batch_size: int,
+                              options: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    """Evalúa un bloque de variantes del escenario dentro de un proceso de trabajo"""
+    engine = MonteCarloEngine(n_simulations=n_simulations, use_database=False, **options)
+    engine.batch_size = batch_size
+    scenarios = [replace(base_scenario, **parameters) for parameters in parameter_sets]
+    return engine.summarize_common(scenarios, seed, time_horizon)
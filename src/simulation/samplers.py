@@ -0,0 +1,90 @@
+import numpy as np
+from typing import Optional, Union
+
+class PseudoRandomSampler:
+    """Normales estándar pseudoaleatorias tomadas del Generator del motor"""
+
+    replicates = 1
+
+    def stream(self, rng, n_paths: int, n_dims: int) -> 'PseudoRandomStream':
+        return PseudoRandomStream(rng, n_dims)
+
+
+class PseudoRandomStream:
+    """Flujo de normales para una ejecución con muestreo pseudoaleatorio"""
+
+    def __init__(self, rng, n_dims: int):
+        self.rng = rng
+        self.n_dims = n_dims
+
+    def normals(self, n_paths: int) -> np.ndarray:
+        return self.rng.standard_normal((n_paths, self.n_dims))
+
+
+class SobolSampler:
+    """Quasi-Monte Carlo con secuencias de Sobol aleatorizadas (scrambled)
+
+    Los puntos uniformes se llevan a normales con la inversa de la normal
+    estándar. Cada flujo usa una aleatorización independiente, de modo que con
+    replicates > 1 el motor puede repartir las trayectorias en réplicas y
+    estimar el error a partir de la dispersión de sus medias.
+    """
+
+    def __init__(self, replicates: int = 1):
+        if replicates < 1:
+            raise ValueError("replicates debe ser al menos 1")
+        self.replicates = replicates
+
+    def stream(self, rng, n_paths: int, n_dims: int) -> 'SobolStream':
+        return SobolStream(rng, n_dims)
+
+
+class SobolStream:
+    """Flujo de normales QMC de una única secuencia de Sobol aleatorizada"""
+
+    # Evita ±inf en la inversa de la normal si un punto cae en el borde del cubo
+    _epsilon = np.finfo(float).eps
+
+    def __init__(self, rng, n_dims: int):
+        # Import diferido: scipy solo se carga si se usa QMC (arranque del motor en 'pseudo')
+        from scipy.special import ndtri
+        self._ndtri = ndtri
+        self.engine = _make_sobol(n_dims, int(rng.integers(0, 2**63)))
+        # Puntos ya generados y aún sin usar (solo tras la primera extracción)
+        self._pending = np.empty((0, n_dims))
+
+    def normals(self, n_paths: int) -> np.ndarray:
+        missing = n_paths - len(self._pending)
+        if missing > 0:
+            # La primera extracción se redondea a una potencia de 2 (balance de los
+            # puntos de Sobol); los sobrantes abren el bloque siguiente o se descartan
+            if self.engine.num_generated == 0:
+                missing = 1 << (missing - 1).bit_length()
+            points = self.engine.random(missing)
+            self._pending = np.concatenate([self._pending, points]) if len(self._pending) else points
+        uniforms, self._pending = self._pending[:n_paths], self._pending[n_paths:]
+        return self._ndtri(np.clip(uniforms, self._epsilon, 1 - self._epsilon))
+
+
+def _make_sobol(n_dims: int, seed: Optional[int]) -> 'qmc.Sobol':
+    """Crea un motor Sobol aleatorizado (scipy >= 1.15 usa rng, versiones previas seed)"""
+    from scipy.stats import qmc
+    try:
+        return qmc.Sobol(d=n_dims, scramble=True, rng=seed)
+    except TypeError:
+        return qmc.Sobol(d=n_dims, scramble=True, seed=seed)
+
+
+def make_sampler(sampler: Union[str, object] = 'pseudo', replicates: int = 1):
+    """Devuelve un muestreador a partir de su nombre, o el propio objeto si ya lo es
+
+    Cualquier objeto con atributo replicates y método stream(rng, n_paths, n_dims)
+    cuyo resultado ofrezca normals(n) sirve como muestreador del motor.
+    """
+    if not isinstance(sampler, str):
+        return sampler
+    if sampler == 'pseudo':
+        return PseudoRandomSampler()
+    if sampler == 'sobol':
+        return SobolSampler(replicates)
+    raise ValueError(f"Muestreador no soportado: {sampler}")
@@ -0,0 +1,111 @@
+import threading
+from typing import Callable, Dict, List, Optional
+from ..models.business_scenario import BusinessScenario, SimulationResult
+from ..utils.statistics import StatisticsCalculator
+from .cache import ResultCache, default_cache
+from .jobs import JobStatus, SimulationJobManager
+from .monte_carlo_engine import MonteCarloEngine
+
+# Valores de los formularios cuando un campo queda vacío
+DEFAULT_INPUTS = {
+    'name': "Escenario Test",
+    'initial_investment': 100000,
+    'revenue_mean': 25000,
+    'revenue_std': 5000,
+    'cost_mean': 15000,
+    'cost_std': 3000,
+}
+
+class SimulationService:
+    """Capa de simulación compartida por las apps: motor, trabajos, cachés y persistencia
+
+    Es dueño de un único MonteCarloEngine con la caché de resultados del proceso
+    y escritura en segundo plano (async_writes), del pool de trabajos y de la
+    caché de métricas (result.risk_metrics, que viaja con los resultados
+    cacheados). Las apps solo construyen escenarios y llaman a submit/status o a
+    simulate; get_service() devuelve la instancia compartida del proceso.
+    """
+
+    def __init__(self, n_simulations: int = 5000, cache: Optional[ResultCache] = None,
+                 use_database: bool = True, async_writes: bool = True, max_workers: Optional[int] = None):
+        self.engine = MonteCarloEngine(n_simulations=n_simulations, use_database=use_database,
+                                       cache=cache if cache is not None else default_cache(),
+                                       async_writes=async_writes)
+        # Las simulaciones de las apps corren en procesos aparte; los callbacks solo consultan su avance
+        self.jobs = SimulationJobManager(self.engine, max_workers=max_workers)
+
+    @property
+    def cache(self) -> ResultCache:
+        return self.engine.cache
+
+    @staticmethod
+    def build_scenario(name: Optional[str] = None, initial_investment: Optional[float] = None,
+                       revenue_mean: Optional[float] = None, revenue_std: Optional[float] = None,
+                       cost_mean: Optional[float] = None, cost_std: Optional[float] = None,
+                       **options) -> BusinessScenario:
+        """Escenario a partir de los valores de un formulario; los vacíos toman DEFAULT_INPUTS"""
+        values = {'name': name, 'initial_investment': initial_investment, 'revenue_mean': revenue_mean,
+                  'revenue_std': revenue_std, 'cost_mean': cost_mean, 'cost_std': cost_std}
+        values = {key: DEFAULT_INPUTS[key] if value is None or value == '' else value
+                  for key, value in values.items()}
+        options = {key: value for key, value in options.items() if value is not None}
+        return BusinessScenario(**values, **options)
+
+    def submit(self, scenario: BusinessScenario,
+               on_complete: Optional[Callable[[SimulationResult], None]] = None) -> str:
+        """Encola la simulación en segundo plano y devuelve el id del trabajo"""
+        return self.jobs.submit(scenario, on_complete=on_complete)
+
+    def status(self, job_id: str) -> Optional[JobStatus]:
+        return self.jobs.status(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        return self.jobs.cancel(job_id)
+
+    def simulate(self, scenario: BusinessScenario) -> SimulationResult:
+        """Simula en este proceso (o sirve desde la caché) y encola su persistencia"""
+        return self.engine.simulate_scenario(scenario)
+
+    def simulate_many(self, scenarios: List[BusinessScenario]) -> List[SimulationResult]:
+        """Simula un lote: sirve desde la caché los escenarios ya simulados y el resto en una sola pasada"""
+        engine = self.engine
+        # simulate_many no aplica variable de control, muestreo por importancia, réplicas QMC
+        # ni procesos: con esas opciones su resultado no es el de simulate_scenario
+        if engine.control_variate or engine.tail_tilt or engine.sampler.replicates > 1 or engine.workers > 1:
+            return [self.simulate(scenario) for scenario in scenarios]
+
+        keys = [engine._cache_key(scenario, engine.seed) for scenario in scenarios]
+        results = {key: self.cache.get(key) for key in keys}
+        missing = {key: scenario for key, scenario in zip(keys, scenarios) if results[key] is None}
+        if missing:
+            # Con números comunes y la semilla del motor cada escenario usa las normales de
+            # simulate_scenario, así que el resultado vale para la misma clave de caché
+            simulated = engine.simulate_many(list(missing.values()), common_random_numbers=True, seed=engine.seed)
+            for key, result in zip(missing, simulated):
+                self.cache.put(key, result)
+                results[key] = result
+        return [results[key] for key in keys]
+
+    @staticmethod
+    def metrics(result: SimulationResult) -> Dict:
+        """Métricas de riesgo del resultado, calculadas una vez y guardadas en él"""
+        return StatisticsCalculator.calculate_risk_metrics(result)
+
+    def shutdown(self):
+        """Detiene el pool de trabajos y vacía la cola de escritura"""
+        self.jobs.shutdown()
+        if self.engine.writer is not None:
+            self.engine.writer.close()
+
+
+_default_service: Optional[SimulationService] = None
+_service_lock = threading.Lock()
+
+
+def get_service() -> SimulationService:
+    """Servicio de simulación compartido del proceso (se crea con la primera app)"""
+    global _default_service
+    with _service_lock:
+        if _default_service is None:
+            _default_service = SimulationService()
+        return _default_service
@@ -3,22 +3,24 @@ from dash import dcc, html, Input, Output, State, dash_table, callback_context
 import plotly.graph_objs as go
 import pandas as pd
 import numpy as np
-from ..simulation.monte_carlo_engine import MonteCarloEngine
-from ..models.business_scenario import BusinessScenario
-from ..utils.statistics import StatisticsCalculator
+from ..simulation.service import get_service
+from ..api.simulation_api import register_simulation_api
 from ..auth.auth_manager import AuthManager
+from .job_controls import job_controls, register_job_callbacks
 from ..database.models import User, Project, SimulationRecord
-from sqlalchemy import create_engine
+from ..database.pool import get_engine
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
+import psycopg2
 import os
 
 class MainApp:
     def __init__(self):
         self.app = dash.Dash(__name__)
-        self.engine = MonteCarloEngine(n_simulations=5000)
+        self.service = get_service()
         try:
             self.auth = AuthManager()
-            self.db_engine = create_engine(os.getenv('DATABASE_URL'))
+            self.db_engine = get_engine(os.getenv('DATABASE_URL'))
             self.Session = sessionmaker(bind=self.db_engine)
             self.auth_enabled = True
         except Exception as e:
@@ -28,6 +30,8 @@ class MainApp:
         self.current_user = None
         self.setup_layout()
         self.setup_callbacks()
+        # API JSON de simulación en el mismo servidor Flask (/api/simulate)
+        register_simulation_api(self.app.server, self.service)
     
     def setup_layout(self):
         self.app.layout = html.Div([
@@ -97,9 +101,18 @@ class MainApp:
                 ], style={'width': '48%', 'display': 'inline-block', 'marginLeft': '4%'})
             ]),
             html.Button("🚀 Ejecutar Simulación", id='run-sim', style={'margin': '20px 0'}),
+            job_controls(),
             html.Div(id='sim-results')
         ], style={'padding': '20px'})
     
+    def simulation_results(self, result, metrics):
+        return html.Div([
+            html.H4("Resultados:"),
+            html.P(f"NPV Promedio: ${metrics['media_npv']:,.0f}"),
+            html.P(f"Probabilidad Éxito: {metrics['probabilidad_exito']:.1f}%"),
+            html.P(f"ROI: {metrics['roi_medio']:.1f}%")
+        ])
+    
     def projects_content(self):
         return html.Div([
             html.H2("📁 Gestión de Proyectos"),
@@ -151,7 +164,13 @@ class MainApp:
         def login(n_clicks, username, password):
             if n_clicks and username and password:
                 if self.auth_enabled:
-                    result = self.auth.login(username, password)
+                    # AuthManager conecta con el primer uso: si la base no responde, modo demo
+                    try:
+                        result = self.auth.login(username, password)
+                    except (OperationalError, psycopg2.OperationalError) as e:
+                        print(f"⚠️ Sistema sin autenticación: {e}")
+                        self.auth_enabled = False
+                        return {'user': {'username': 'demo'}}, ""
                     if result['success']:
                         self.current_user = result['user']
                         return result, ""
@@ -178,35 +197,27 @@ class MainApp:
             return self.dashboard_content()
         
         @self.app.callback(
-            Output('sim-results', 'children'),
+            Output('simulation-job', 'data'),
             Input('run-sim', 'n_clicks'),
             [State('project-name', 'value'), State('scenario-name', 'value'),
-             State('investment', 'value'), State('revenue', 'value')]
+             State('investment', 'value'), State('revenue', 'value')],
+            prevent_initial_call=True
         )
         def run_simulation(n_clicks, project_name, scenario_name, investment, revenue):
             if not n_clicks:
-                return ""
+                return dash.no_update
             
-            scenario = BusinessScenario(
-                name=scenario_name,
-                initial_investment=investment,
-                revenue_mean=revenue,
+            revenue = revenue or 25000
+            scenario = self.service.build_scenario(
+                scenario_name, investment, revenue,
                 revenue_std=revenue*0.2,
                 cost_mean=revenue*0.6,
-                cost_std=revenue*0.1,
-                inflation_rate=0.03,
-                market_volatility=0.15
+                cost_std=revenue*0.1
             )
             
-            result = self.engine.simulate_scenario(scenario)
-            metrics = StatisticsCalculator.calculate_risk_metrics(result)
-            
-            return html.Div([
-                html.H4("Resultados:"),
-                html.P(f"NPV Promedio: ${metrics['media_npv']:,.0f}"),
-                html.P(f"Probabilidad Éxito: {metrics['probabilidad_exito']:.1f}%"),
-                html.P(f"ROI: {metrics['roi_medio']:.1f}%")
-            ])
+            return self.service.submit(scenario)
+        
+        register_job_callbacks(self.app, self.service, 'sim-results', self.simulation_results)
         
         @self.app.callback(
             Output('users-table', 'children'),
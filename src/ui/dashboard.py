@@ -3,17 +3,19 @@ from dash import dcc, html, Input, Output, State, dash_table
 import plotly.graph_objs as go
 import pandas as pd
 import numpy as np
-from ..simulation.monte_carlo_engine import MonteCarloEngine
-from ..models.business_scenario import BusinessScenario
+from ..simulation.service import get_service
+from ..api.simulation_api import register_simulation_api
 from ..utils.statistics import StatisticsCalculator
 from ..database.db_manager import DatabaseManager
+from .job_controls import job_controls, progress_view, register_job_callbacks
 
 class DecisionDashboard:
     """Dashboard interactivo para análisis de decisiones empresariales"""
     
     def __init__(self):
         self.app = dash.Dash(__name__)
-        self.engine = MonteCarloEngine(n_simulations=5000)
+        # Motor, cachés y trabajos compartidos con las demás apps del proceso
+        self.service = get_service()
         try:
             self.db = DatabaseManager()
             self.db_enabled = True
@@ -23,6 +25,8 @@ class DecisionDashboard:
             self.db_enabled = False
         self.setup_layout()
         self.setup_callbacks()
+        # API JSON de simulación en el mismo servidor Flask (/api/simulate)
+        register_simulation_api(self.app.server, self.service)
     
     def setup_layout(self):
         """Configura el layout del dashboard"""
@@ -79,11 +83,14 @@ class DecisionDashboard:
                 ], style={'display': 'flex', 'flexWrap': 'wrap', 'gap': '15px', 'marginTop': '15px'}),
                 
                 html.Button("🚀 Ejecutar Simulación", id='run-simulation', 
-                           style={'marginTop': '20px', 'padding': '10px 20px', 'fontSize': '16px'})
+                           style={'marginTop': '20px', 'padding': '10px 20px', 'fontSize': '16px'}),
+                job_controls()
             ], style={'backgroundColor': '#ecf0f1', 'padding': '20px', 'borderRadius': '10px', 'marginBottom': '20px'}),
             
             # Resultados
-            html.Div(id='results-container'),
+            html.Div(html.Div("👆 Configure los parámetros y ejecute la simulación", 
+                              style={'textAlign': 'center', 'color': '#7f8c8d', 'fontSize': '18px'}),
+                     id='results-container'),
             
         ], style={'maxWidth': '1200px', 'margin': '0 auto', 'padding': '20px'})
     
@@ -91,7 +98,7 @@ class DecisionDashboard:
         """Configura los callbacks del dashboard"""
         
         @self.app.callback(
-            Output('results-container', 'children'),
+            Output('simulation-job', 'data'),
             Input('run-simulation', 'n_clicks'),
             [State('scenario-name', 'value'),
              State('initial-investment', 'value'),
@@ -100,39 +107,33 @@ class DecisionDashboard:
              State('cost-mean', 'value'),
              State('cost-std', 'value'),
              State('inflation-rate', 'value'),
-             State('market-volatility', 'value')]
+             State('market-volatility', 'value')],
+            prevent_initial_call=True
         )
         def run_simulation(n_clicks, name, investment, rev_mean, rev_std, 
                           cost_mean, cost_std, inflation, volatility):
             
-            if not n_clicks:
-                return html.Div("👆 Configure los parámetros y ejecute la simulación", 
-                               style={'textAlign': 'center', 'color': '#7f8c8d', 'fontSize': '18px'})
-            
             # Crear escenario
-            scenario = BusinessScenario(
-                name=name,
-                initial_investment=investment,
-                revenue_mean=rev_mean,
-                revenue_std=rev_std,
-                cost_mean=cost_mean,
-                cost_std=cost_std,
+            scenario = self.service.build_scenario(
+                name, investment, rev_mean, rev_std, cost_mean, cost_std,
                 inflation_rate=inflation,
                 market_volatility=volatility
             )
             
-            # Ejecutar simulación
-            result = self.engine.simulate_scenario(scenario)
-            metrics = StatisticsCalculator.calculate_risk_metrics(result)
-            
-            # Guardar en base de datos
-            if self.db_enabled:
-                try:
-                    self.db.save_simulation(scenario, result, metrics)
-                except Exception as e:
-                    print(f"Error guardando simulación: {e}")
+            # Guardar en base de datos al terminar
+            def save_simulation(result):
+                if self.db_enabled:
+                    try:
+                        metrics = self.service.metrics(result)
+                        self.db.save_simulation(scenario, result, metrics)
+                    except Exception as e:
+                        print(f"Error guardando simulación: {e}")
             
-            return self.create_results_layout(result, metrics)
+            # Ejecutar simulación en segundo plano; el sondeo muestra avance y resultados
+            return self.service.submit(scenario, on_complete=save_simulation)
+        
+        register_job_callbacks(self.app, self.service, 'results-container', self.create_results_layout,
+                               render_partial=self.create_partial_layout)
     
     def create_results_layout(self, result, metrics):
         """Crea el layout de resultados"""
@@ -165,35 +166,84 @@ class DecisionDashboard:
             self.create_statistics_table(metrics)
         ])
     
-    def create_metric_card(self, title, value, color):
+    def create_partial_layout(self, status):
+        """Crea el layout de estimaciones parciales mientras la simulación avanza"""
+        partial = status.partial
+        
+        return html.Div([
+            html.H3("📈 Resultados Preliminares"),
+            progress_view(status),
+            html.Div([
+                self.create_metric_card("NPV Promedio", f"${partial['media_npv']:,.0f}",
+                                       "green" if partial['media_npv'] > 0 else "red",
+                                       f"± ${partial['media_npv_ic']:,.0f} (IC 95%)"),
+                self.create_metric_card("Probabilidad de Éxito", f"{partial['probabilidad_exito']:.1f}%",
+                                       "green" if partial['probabilidad_exito'] > 50 else "orange",
+                                       f"± {partial['probabilidad_exito_ic']:.1f} pp (IC 95%)"),
+                self.create_metric_card("ROI Promedio", f"{partial['roi_medio']:.1f}%",
+                                       "green" if partial['roi_medio'] > 0 else "red",
+                                       f"± {partial['roi_medio_ic']:.1f} pp (IC 95%)"),
+                self.create_metric_card("Break-even Promedio", f"{partial['break_even_medio']:.1f} meses", "blue"),
+            ], style={'display': 'flex', 'gap': '15px', 'margin': '20px 0'}),
+            
+            dcc.Graph(figure=self.create_partial_histogram(partial))
+        ])
+    
+    def create_metric_card(self, title, value, color, note=None):
         """Crea una tarjeta de métrica"""
         return html.Div([
             html.H4(title, style={'margin': '0', 'color': '#2c3e50'}),
-            html.H2(value, style={'margin': '10px 0', 'color': color})
+            html.H2(value, style={'margin': '10px 0', 'color': color}),
+            html.Small(note, style={'color': '#7f8c8d'}) if note else None
         ], style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 
                  'boxShadow': '0 2px 4px rgba(0,0,0,0.1)', 'textAlign': 'center', 'flex': '1'})
     
     def create_npv_histogram(self, result):
         """Crea histograma de distribución NPV"""
+        # Binning en el servidor: la figura no crece con el número de trayectorias
+        histogram = StatisticsCalculator.histogram(result.net_present_values, result.weights)
+        return self.create_histogram_figure(histogram, result.percentile_5, result.percentile_95,
+                                            "Distribución de Valor Presente Neto (NPV)")
+    
+    def create_partial_histogram(self, partial):
+        """Crea histograma NPV a partir de los conteos parciales por intervalo"""
+        return self.create_histogram_figure(
+            partial.get('histograma'), partial['percentil_5'], partial['percentil_95'],
+            f"Distribución de NPV ({partial['completed']:,} de {partial['total']:,} trayectorias)")
+    
+    def create_histogram_figure(self, histogram, percentile_5, percentile_95, title):
+        """Crea la figura de un histograma ya agrupado en intervalos (con KDE si la incluye)"""
         fig = go.Figure()
-        fig.add_trace(go.Histogram(
-            x=result.net_present_values,
-            nbinsx=50,
-            name='Distribución NPV',
-            marker_color='rgba(55, 128, 191, 0.7)'
-        ))
+        if histogram:
+            edges = np.asarray(histogram['bordes'])
+            fig.add_trace(go.Bar(
+                x=(edges[:-1] + edges[1:]) / 2,
+                y=histogram['frecuencias'],
+                width=np.diff(edges),
+                name='Distribución NPV',
+                marker_color='rgba(55, 128, 191, 0.7)'
+            ))
+            if 'kde_x' in histogram:
+                fig.add_trace(go.Scatter(
+                    x=histogram['kde_x'],
+                    y=histogram['kde_y'],
+                    mode='lines',
+                    name='Densidad (KDE)',
+                    line=dict(color='rgb(31, 60, 136)', width=2)
+                ))
         
         # Líneas de percentiles
-        fig.add_vline(x=result.percentile_5, line_dash="dash", line_color="red", 
-                     annotation_text=f"P5: ${result.percentile_5:,.0f}")
-        fig.add_vline(x=result.percentile_95, line_dash="dash", line_color="green", 
-                     annotation_text=f"P95: ${result.percentile_95:,.0f}")
+        fig.add_vline(x=percentile_5, line_dash="dash", line_color="red", 
+                     annotation_text=f"P5: ${percentile_5:,.0f}")
+        fig.add_vline(x=percentile_95, line_dash="dash", line_color="green", 
+                     annotation_text=f"P95: ${percentile_95:,.0f}")
         
         fig.update_layout(
-            title="Distribución de Valor Presente Neto (NPV)",
+            title=title,
             xaxis_title="NPV ($)",
             yaxis_title="Frecuencia",
-            showlegend=False
+            showlegend=False,
+            bargap=0
         )
         return fig
     
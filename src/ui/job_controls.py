@@ -0,0 +1,70 @@
+import dash
+from dash import dcc, html, Input, Output, no_update
+from ..simulation.jobs import JobStatus
+from ..simulation.service import SimulationService
+
+def job_controls(prefix: str = 'simulation', interval_ms: int = 500) -> html.Div:
+    """Componentes para seguir un trabajo: id del trabajo, sondeo periódico y cancelación"""
+    return html.Div([
+        dcc.Store(id=f'{prefix}-job'),
+        dcc.Interval(id=f'{prefix}-poll', interval=interval_ms, disabled=True),
+        html.Button("⏹ Cancelar", id=f'{prefix}-cancel', style={'marginTop': '20px', 'marginLeft': '10px'}),
+    ], style={'display': 'inline-block'})
+
+
+def has_estimates(status: JobStatus) -> bool:
+    """True si el trabajo ya publicó estimaciones parciales (no solo su avance)"""
+    return bool(status.partial) and 'media_npv' in status.partial
+
+
+def progress_view(status: JobStatus) -> html.Div:
+    """Barra de avance de un trabajo en curso, con el NPV estimado hasta el momento"""
+    label = "⏳ En cola..." if status.state == 'pending' else (
+        f"⏳ Simulando... {status.fraction:.0%} ({status.completed:,} / {status.total:,} trayectorias)")
+    children = [
+        html.P(label, style={'color': '#7f8c8d'}),
+        html.Progress(value=str(status.completed), max=str(status.total), style={'width': '100%'}),
+    ]
+    if has_estimates(status):
+        partial = status.partial
+        children.append(html.P(f"NPV estimado: ${partial['media_npv']:,.0f} ± ${partial['media_npv_ic']:,.0f} (IC 95%)",
+                               style={'color': '#7f8c8d'}))
+    return html.Div(children, style={'textAlign': 'center'})
+
+
+def register_job_callbacks(app: dash.Dash, service: SimulationService, results_id: str,
+                           render, prefix: str = 'simulation', render_partial=None):
+    """Sondea el trabajo guardado en '{prefix}-job' y muestra su avance o su resultado
+
+    render(result, metrics) construye el contenido final en results_id y
+    render_partial(status), si se indica, el contenido mientras corre a partir de
+    las estimaciones parciales (por defecto, progress_view). El sondeo se activa
+    al enviar un trabajo y se detiene cuando termina o se cancela.
+    """
+
+    @app.callback(
+        [Output(results_id, 'children'),
+         Output(f'{prefix}-poll', 'disabled')],
+        [Input(f'{prefix}-job', 'data'),
+         Input(f'{prefix}-poll', 'n_intervals'),
+         Input(f'{prefix}-cancel', 'n_clicks')],
+        prevent_initial_call=True
+    )
+    def poll_job(job_id, n_intervals, cancel_clicks):
+        if not job_id:
+            return no_update, True
+        if dash.ctx.triggered_id == f'{prefix}-cancel':
+            service.cancel(job_id)
+
+        status = service.status(job_id)
+        if status is None:
+            return html.Div("⚠️ La simulación ya no está disponible, ejecútela de nuevo"), True
+        if status.state == 'done':
+            return render(status.result, service.metrics(status.result)), True
+        if status.state == 'cancelled':
+            return html.Div("⏹ Simulación cancelada", style={'textAlign': 'center', 'color': '#7f8c8d'}), True
+        if status.state == 'error':
+            return html.Div(f"❌ Error en la simulación: {status.error}", style={'color': '#e74c3c'}), True
+        if render_partial is not None and has_estimates(status):
+            return render_partial(status), False
+        return progress_view(status), False
@@ -3,18 +3,20 @@ from dash import dcc, html, Input, Output, State, dash_table, callback_context
 import plotly.graph_objs as go
 import pandas as pd
 import numpy as np
-from ..simulation.monte_carlo_engine import MonteCarloEngine
-from ..models.business_scenario import BusinessScenario
-from ..utils.statistics import StatisticsCalculator
+from ..simulation.service import get_service
+from ..api.simulation_api import register_simulation_api
+from .job_controls import job_controls, register_job_callbacks
 
 class MonteCarloApp:
     def __init__(self):
         self.app = dash.Dash(__name__)
-        self.engine = MonteCarloEngine(n_simulations=5000)
+        self.service = get_service()
         self.current_user = {'id': 1, 'username': 'admin', 'role': 'admin'}
         self.logged_in = False
         self.setup_layout()
         self.setup_callbacks()
+        # API JSON de simulación en el mismo servidor Flask (/api/simulate)
+        register_simulation_api(self.app.server, self.service)
     
     def setup_layout(self):
         self.app.layout = html.Div([
@@ -194,11 +196,12 @@ class MonteCarloApp:
                         'backgroundColor': '#e74c3c', 'color': 'white',
                         'border': 'none', 'borderRadius': '5px', 'fontSize': '16px'
                     }
-                )
+                ),
+                job_controls()
             ], style={'backgroundColor': '#f8f9fa', 'padding': '20px', 'borderRadius': '8px', 'marginBottom': '20px'}),
             
             # Resultados
-            html.Div(id='simulation-results')
+            html.Div(html.Div("👆 Configure los parámetros y ejecute la simulación"), id='simulation-results')
         ])
     
     def visualizations_page(self):
@@ -260,48 +263,45 @@ class MonteCarloApp:
             return self.dashboard_page()
         
         @self.app.callback(
-            Output('simulation-results', 'children'),
+            Output('simulation-job', 'data'),
             Input('run-simulation', 'n_clicks'),
             [State('scenario-name', 'value'), State('initial-investment', 'value'),
-             State('revenue-mean', 'value'), State('revenue-std', 'value')]
+             State('revenue-mean', 'value'), State('revenue-std', 'value')],
+            prevent_initial_call=True
         )
         def run_simulation(n_clicks, name, investment, revenue_mean, revenue_std):
             if not n_clicks:
-                return html.Div("👆 Configure los parámetros y ejecute la simulación")
+                return dash.no_update
             
             # Crear escenario
-            scenario = BusinessScenario(
-                name=name or "Escenario Test",
-                initial_investment=investment or 100000,
-                revenue_mean=revenue_mean or 25000,
-                revenue_std=revenue_std or 5000,
-                cost_mean=15000,
-                cost_std=3000
-            )
-            
-            # Ejecutar simulación
-            result = self.engine.simulate_scenario(scenario)
-            metrics = StatisticsCalculator.calculate_risk_metrics(result)
+            scenario = self.service.build_scenario(name, investment, revenue_mean, revenue_std)
             
-            return html.Div([
-                html.H3("📈 Resultados de la Simulación"),
+            # Ejecutar simulación en segundo plano; el sondeo muestra avance y resultados
+            return self.service.submit(scenario)
+        
+        register_job_callbacks(self.app, self.service, 'simulation-results', self.simulation_results)
+    
+    def simulation_results(self, result, metrics):
+        """Tarjetas con las métricas principales de una simulación terminada"""
+        return html.Div([
+            html.H3("📈 Resultados de la Simulación"),
+            html.Div([
                 html.Div([
-                    html.Div([
-                        html.H4(f"${metrics['media_npv']:,.0f}"),
-                        html.P("NPV Promedio")
-                    ], style={'backgroundColor': '#2ecc71', 'color': 'white', 'padding': '20px', 'borderRadius': '8px', 'textAlign': 'center', 'margin': '10px'}),
-                    
-                    html.Div([
-                        html.H4(f"{metrics['probabilidad_exito']:.1f}%"),
-                        html.P("Probabilidad de Éxito")
-                    ], style={'backgroundColor': '#3498db', 'color': 'white', 'padding': '20px', 'borderRadius': '8px', 'textAlign': 'center', 'margin': '10px'}),
-                    
-                    html.Div([
-                        html.H4(f"{metrics['roi_medio']:.1f}%"),
-                        html.P("ROI Promedio")
-                    ], style={'backgroundColor': '#e74c3c', 'color': 'white', 'padding': '20px', 'borderRadius': '8px', 'textAlign': 'center', 'margin': '10px'})
-                ], style={'display': 'flex', 'justifyContent': 'space-around'})
-            ])
+                    html.H4(f"${metrics['media_npv']:,.0f}"),
+                    html.P("NPV Promedio")
+                ], style={'backgroundColor': '#2ecc71', 'color': 'white', 'padding': '20px', 'borderRadius': '8px', 'textAlign': 'center', 'margin': '10px'}),
+                
+                html.Div([
+                    html.H4(f"{metrics['probabilidad_exito']:.1f}%"),
+                    html.P("Probabilidad de Éxito")
+                ], style={'backgroundColor': '#3498db', 'color': 'white', 'padding': '20px', 'borderRadius': '8px', 'textAlign': 'center', 'margin': '10px'}),
+                
+                html.Div([
+                    html.H4(f"{metrics['roi_medio']:.1f}%"),
+                    html.P("ROI Promedio")
+                ], style={'backgroundColor': '#e74c3c', 'color': 'white', 'padding': '20px', 'borderRadius': '8px', 'textAlign': 'center', 'margin': '10px'})
+            ], style={'display': 'flex', 'justifyContent': 'space-around'})
+        ])
     
     def run_server(self, debug=False, port=8050):
         self.app.run(debug=debug, port=port, host='0.0.0.0')
\ No newline at end of file
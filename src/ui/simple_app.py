@@ -2,14 +2,14 @@ import dash
 from dash import dcc, html, Input, Output, State
 import plotly.graph_objs as go
 import numpy as np
-from ..simulation.monte_carlo_engine import MonteCarloEngine
-from ..models.business_scenario import BusinessScenario
-from ..utils.statistics import StatisticsCalculator
+from ..simulation.service import get_service
+from ..api.simulation_api import register_simulation_api
+from .job_controls import job_controls, register_job_callbacks
 
 class SimpleApp:
     def __init__(self):
         self.app = dash.Dash(__name__)
-        self.engine = MonteCarloEngine(n_simulations=5000)
+        self.service = get_service()
         self.logged_in = False
         # Base de datos simulada de usuarios
         self.users_db = [
@@ -20,6 +20,8 @@ class SimpleApp:
         self.next_user_id = 4
         self.setup_layout()
         self.setup_callbacks()
+        # API JSON de simulación en el mismo servidor Flask (/api/simulate)
+        register_simulation_api(self.app.server, self.service)
     
     def setup_layout(self):
         self.app.layout = html.Div([
@@ -93,7 +95,7 @@ class SimpleApp:
             return self.dashboard_content()
         
         @self.app.callback(
-            Output('simulation-results', 'children'),
+            Output('simulation-job', 'data'),
             Input('run-simulation', 'n_clicks'),
             [State('scenario-name', 'value'),
              State('initial-investment', 'value'),
@@ -103,39 +105,13 @@ class SimpleApp:
         )
         def run_simulation(n_clicks, name, investment, revenue_mean, revenue_std):
             if not n_clicks:
-                return html.Div()
+                return dash.no_update
             
-            scenario = BusinessScenario(
-                name=name or "Escenario Test",
-                initial_investment=investment or 100000,
-                revenue_mean=revenue_mean or 25000,
-                revenue_std=revenue_std or 5000,
-                cost_mean=15000,
-                cost_std=3000
-            )
+            scenario = self.service.build_scenario(name, investment, revenue_mean, revenue_std)
             
-            result = self.engine.simulate_scenario(scenario)
-            metrics = StatisticsCalculator.calculate_risk_metrics(result)
-            
-            return html.Div([
-                html.H3("📈 Resultados de la Simulación", style={'color': '#2c3e50'}),
-                html.Div([
-                    html.Div([
-                        html.H2(f"${metrics['media_npv']:,.0f}", style={'color': 'white', 'margin': 0}),
-                        html.P("NPV Promedio", style={'color': 'white', 'margin': 0})
-                    ], style={'backgroundColor': '#27ae60', 'padding': '20px', 'borderRadius': '8px', 'textAlign': 'center', 'margin': '10px', 'minWidth': '200px'}),
-                    
-                    html.Div([
-                        html.H2(f"{metrics['probabilidad_exito']:.1f}%", style={'color': 'white', 'margin': 0}),
-                        html.P("Probabilidad Éxito", style={'color': 'white', 'margin': 0})
-                    ], style={'backgroundColor': '#3498db', 'padding': '20px', 'borderRadius': '8px', 'textAlign': 'center', 'margin': '10px', 'minWidth': '200px'}),
-                    
-                    html.Div([
-                        html.H2(f"{metrics['roi_medio']:.1f}%", style={'color': 'white', 'margin': 0}),
-                        html.P("ROI Promedio", style={'color': 'white', 'margin': 0})
-                    ], style={'backgroundColor': '#e74c3c', 'padding': '20px', 'borderRadius': '8px', 'textAlign': 'center', 'margin': '10px', 'minWidth': '200px'})
-                ], style={'display': 'flex', 'justifyContent': 'center', 'flexWrap': 'wrap'})
-            ])
+            return self.service.submit(scenario)
+        
+        register_job_callbacks(self.app, self.service, 'simulation-results', self.simulation_results)
         
         @self.app.callback(
             Output('users-data', 'data'),
@@ -372,11 +348,34 @@ class SimpleApp:
                     ], style={'width': '48%', 'display': 'inline-block'})
                 ], style={'marginTop': '15px'}),
                 html.Button("🚀 Ejecutar Simulación", id='run-simulation', 
-                           style={'marginTop': '20px', 'padding': '12px 30px', 'backgroundColor': '#e74c3c', 'color': 'white', 'border': 'none', 'borderRadius': '5px', 'fontSize': '16px', 'cursor': 'pointer'})
+                           style={'marginTop': '20px', 'padding': '12px 30px', 'backgroundColor': '#e74c3c', 'color': 'white', 'border': 'none', 'borderRadius': '5px', 'fontSize': '16px', 'cursor': 'pointer'}),
+                job_controls()
             ], style={'backgroundColor': '#f8f9fa', 'padding': '20px', 'borderRadius': '8px', 'marginBottom': '20px'}),
             html.Div(id='simulation-results')
         ])
     
+    def simulation_results(self, result, metrics):
+        """Tarjetas con las métricas principales de una simulación terminada"""
+        return html.Div([
+            html.H3("📈 Resultados de la Simulación", style={'color': '#2c3e50'}),
+            html.Div([
+                html.Div([
+                    html.H2(f"${metrics['media_npv']:,.0f}", style={'color': 'white', 'margin': 0}),
+                    html.P("NPV Promedio", style={'color': 'white', 'margin': 0})
+                ], style={'backgroundColor': '#27ae60', 'padding': '20px', 'borderRadius': '8px', 'textAlign': 'center', 'margin': '10px', 'minWidth': '200px'}),
+                
+                html.Div([
+                    html.H2(f"{metrics['probabilidad_exito']:.1f}%", style={'color': 'white', 'margin': 0}),
+                    html.P("Probabilidad Éxito", style={'color': 'white', 'margin': 0})
+                ], style={'backgroundColor': '#3498db', 'padding': '20px', 'borderRadius': '8px', 'textAlign': 'center', 'margin': '10px', 'minWidth': '200px'}),
+                
+                html.Div([
+                    html.H2(f"{metrics['roi_medio']:.1f}%", style={'color': 'white', 'margin': 0}),
+                    html.P("ROI Promedio", style={'color': 'white', 'margin': 0})
+                ], style={'backgroundColor': '#e74c3c', 'padding': '20px', 'borderRadius': '8px', 'textAlign': 'center', 'margin': '10px', 'minWidth': '200px'})
+            ], style={'display': 'flex', 'justifyContent': 'center', 'flexWrap': 'wrap'})
+        ])
+    
     def visualizations_page(self):
         return html.Div([
             html.H2("📈 Visualizaciones", style={'color': '#2c3e50'}),
@@ -0,0 +1,310 @@
+import math
+import numpy as np
+from typing import Dict, Optional
+
+class RunningMoments:
+    """Media, varianza, asimetría y curtosis en línea (Welford/Chan por bloques)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+        self.m4 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values: np.ndarray):
+        """Incorpora un bloque de valores combinando sus momentos con los acumulados"""
+        values = np.asarray(values, dtype=float).ravel()
+        n_b = values.size
+        if n_b == 0:
+            return
+
+        mean_b = values.mean()
+        centered = values - mean_b
+        squared = centered * centered
+        m2_b = squared.sum()
+        m3_b = (squared * centered).sum()
+        m4_b = (squared * squared).sum()
+
+        n_a = self.count
+        n = n_a + n_b
+        delta = mean_b - self.mean
+        m2_a, m3_a = self.m2, self.m3
+
+        self.m4 += (m4_b + delta ** 4 * n_a * n_b * (n_a * n_a - n_a * n_b + n_b * n_b) / n ** 3
+                    + 6 * delta ** 2 * (n_a * n_a * m2_b + n_b * n_b * m2_a) / n ** 2
+                    + 4 * delta * (n_a * m3_b - n_b * m3_a) / n)
+        self.m3 += (m3_b + delta ** 3 * n_a * n_b * (n_a - n_b) / n ** 2
+                    + 3 * delta * (n_a * m2_b - n_b * m2_a) / n)
+        self.m2 += m2_b + delta ** 2 * n_a * n_b / n
+        self.mean += delta * n_b / n
+        self.count = n
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    @property
+    def variance(self) -> float:
+        """Varianza poblacional (ddof=0, igual que np.std)"""
+        return self.m2 / self.count if self.count else float('nan')
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def std_error(self) -> float:
+        """Error estándar de la media"""
+        return self.std / math.sqrt(self.count) if self.count else float('inf')
+
+    @property
+    def skewness(self) -> float:
+        """Asimetría muestral ajustada (misma fórmula que pandas)"""
+        n = self.count
+        if n < 3 or self.m2 == 0:
+            return 0.0
+        return n * math.sqrt(n - 1) / (n - 2) * self.m3 / self.m2 ** 1.5
+
+    @property
+    def kurtosis(self) -> float:
+        """Curtosis en exceso muestral ajustada (misma fórmula que pandas)"""
+        n = self.count
+        if n < 4 or self.m2 == 0:
+            return 0.0
+        adjustment = 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+        return n * (n + 1) * (n - 1) * self.m4 / ((n - 2) * (n - 3) * self.m2 ** 2) - adjustment
+
+
+class TDigest:
+    """t-digest por fusión para cuantiles aproximados con memoria acotada
+
+    Los centroides se agrupan con la función de escala k1, de modo que las colas
+    conservan centroides pequeños y los cuantiles extremos son más precisos.
+    """
+
+    def __init__(self, compression: int = 200):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values: np.ndarray):
+        """Fusiona un bloque de valores con los centroides actuales"""
+        values = np.asarray(values, dtype=float).ravel()
+        if values.size == 0:
+            return
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+        means = np.concatenate([self.means, values])
+        weights = np.concatenate([self.weights, np.ones(values.size)])
+        order = np.argsort(means, kind='mergesort')
+        means, weights = means[order], weights[order]
+
+        total = weights.sum()
+        q_mid = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression * (np.arcsin(2 * q_mid - 1) / np.pi + 0.5)
+        bucket = np.floor(k)
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(bucket)) + 1])
+
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    @property
+    def count(self) -> float:
+        return self.weights.sum()
+
+    def quantile(self, q) -> np.ndarray:
+        """Cuantiles (0-1) interpolando entre los centros de los centroides"""
+        total = self.count
+        if total == 0:
+            return np.full(np.shape(q), np.nan)
+        centers = np.cumsum(self.weights) - self.weights / 2
+        positions = np.concatenate([[0.0], centers, [total]])
+        means = np.concatenate([[self.min], self.means, [self.max]])
+        return np.interp(np.asarray(q) * total, positions, means)
+
+
+class TailBuffer:
+    """Conserva exactamente los k valores más bajos vistos (cola izquierda)
+
+    Los candidatos se acumulan por debajo del umbral vigente y solo se compactan
+    con np.partition cuando el búfer dobla su capacidad, así el coste por bloque
+    es amortizado y no depende del tamaño de la cola.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.values = np.empty(0)
+        self.threshold = math.inf
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=float).ravel()
+        candidates = values[values <= self.threshold]
+        self.values = np.concatenate([self.values, candidates])
+        if self.values.size > 2 * self.capacity:
+            self._compact()
+
+    def _compact(self):
+        if self.values.size > self.capacity:
+            self.values = np.partition(self.values, self.capacity - 1)[:self.capacity]
+            self.threshold = self.values.max()
+
+    def percentile(self, q: float, count: int) -> float:
+        """Percentil exacto (interpolación lineal como np.percentile) sobre count valores totales"""
+        position = q / 100 * (count - 1)
+        lower = int(math.floor(position))
+        upper = min(lower + 1, self.values.size - 1)
+        ordered = np.partition(self.values, [lower, upper])
+        return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+    def tail_mean(self, threshold: float) -> float:
+        """Media de los valores menores o iguales al umbral (CVaR)"""
+        tail = self.values[self.values <= threshold]
+        return tail.mean() if tail.size else float('nan')
+
+
+class StreamingAggregator:
+    """Agregados en línea de NPV, ROI y break-even para simulaciones por bloques
+
+    Mantiene momentos, un t-digest, búferes exactos para ambas colas de NPV (VaR y
+    CVaR al 95% y 99%, percentiles 5/95) y conteos de break-even por mes, sin guardar las
+    trayectorias. Con histogram_bins > 0 también cuenta el NPV en intervalos fijos,
+    definidos a partir del primer bloque (media ± 4 desviaciones; los valores
+    fuera de rango se acumulan en los intervalos extremos).
+    """
+
+    tail_probability = 0.05
+
+    def __init__(self, total_paths: int, time_horizon: int, compression: int = 200,
+                 histogram_bins: int = 0):
+        self.total_paths = total_paths
+        # Suficientes valores para interpolar el percentil 5 exacto del total de trayectorias
+        capacity = int(math.floor(self.tail_probability * (total_paths - 1))) + 2
+        self.npv = RunningMoments()
+        self.npv_digest = TDigest(compression)
+        self.lower_tail = TailBuffer(capacity)
+        self.upper_tail = TailBuffer(capacity)
+        self.roi = RunningMoments()
+        self.break_even_counts = np.zeros(time_horizon + 1, dtype=np.int64)
+        self.successes = 0
+        self.positive_roi = 0
+        self.histogram_bins = histogram_bins
+        self.histogram_edges: Optional[np.ndarray] = None
+        self.histogram_counts: Optional[np.ndarray] = None
+
+    @property
+    def count(self) -> int:
+        return self.npv.count
+
+    def update(self, npv_values: np.ndarray, roi_values: np.ndarray, break_even_months: np.ndarray):
+        """Incorpora un bloque de trayectorias simuladas"""
+        self.npv.update(npv_values)
+        self.npv_digest.update(npv_values)
+        self.lower_tail.update(npv_values)
+        self.upper_tail.update(-npv_values)
+        self.roi.update(roi_values)
+        self.break_even_counts += np.bincount(break_even_months.astype(np.int64),
+                                              minlength=self.break_even_counts.size)
+        self.successes += int(np.count_nonzero(npv_values > 0))
+        self.positive_roi += int(np.count_nonzero(roi_values > 0))
+        if self.histogram_bins:
+            self._update_histogram(npv_values)
+
+    def _update_histogram(self, npv_values: np.ndarray):
+        if self.histogram_edges is None:
+            spread = 4 * self.npv.std or max(abs(self.npv.mean), 1.0)
+            self.histogram_edges = np.linspace(self.npv.mean - spread, self.npv.mean + spread,
+                                               self.histogram_bins + 1)
+            self.histogram_counts = np.zeros(self.histogram_bins, dtype=np.int64)
+        clipped = np.clip(npv_values, self.histogram_edges[0], self.histogram_edges[-1])
+        self.histogram_counts += np.histogram(clipped, bins=self.histogram_edges)[0]
+
+    @property
+    def success_probability(self) -> float:
+        return self.successes / self.count * 100 if self.count else 0.0
+
+    def snapshot(self, z: float = 1.96) -> Dict:
+        """Estimaciones parciales con el semiancho de su intervalo de confianza (_ic, nivel z)
+
+        Solo contiene tipos de Python, para publicarse entre procesos o como JSON.
+        """
+        n = self.count
+        # Proporción suavizada: el intervalo no colapsa a cero con 0 o n éxitos
+        smoothed = (self.successes + 0.5) / (n + 1)
+        # Percentiles del t-digest: los búferes exactos de las colas se ordenarían en cada bloque
+        percentile_5, percentile_95 = self.npv_digest.quantile([0.05, 0.95])
+        snapshot = {
+            'completed': n,
+            'total': self.total_paths,
+            'media_npv': float(self.npv.mean),
+            'media_npv_ic': float(z * self.npv.std_error),
+            'probabilidad_exito': self.success_probability,
+            'probabilidad_exito_ic': z * math.sqrt(smoothed * (1 - smoothed) / n) * 100,
+            'roi_medio': float(self.roi.mean),
+            'roi_medio_ic': float(z * self.roi.std_error),
+            'percentil_5': float(percentile_5),
+            'percentil_95': float(percentile_95),
+            'break_even_medio': float(np.arange(self.break_even_counts.size) @ self.break_even_counts) / n,
+        }
+        if self.histogram_counts is not None:
+            snapshot['histograma'] = {'bordes': self.histogram_edges.tolist(),
+                                      'frecuencias': self.histogram_counts.tolist()}
+        return snapshot
+
+    def percentile_5(self) -> float:
+        return self.lower_tail.percentile(5, self.count)
+
+    def percentile_95(self) -> float:
+        return -self.upper_tail.percentile(5, self.count)
+
+    def risk_metrics(self) -> Dict:
+        """Métricas con las mismas claves que StatisticsCalculator.calculate_risk_metrics"""
+        n = self.count
+        var_95 = self.percentile_5()
+        # El búfer inferior guarda el 5% más bajo: el 1% y su cola también son exactos
+        var_99 = self.lower_tail.percentile(1, n)
+        mean_npv = self.npv.mean
+        quantiles = self.npv_digest.quantile([0.10, 0.25, 0.50, 0.75, 0.90])
+
+        metrics = {
+            'media_npv': mean_npv,
+            'desviacion_std': self.npv.std,
+            'coeficiente_variacion': self.npv.std / abs(mean_npv) if mean_npv != 0 else float('inf'),
+            'probabilidad_exito': self.success_probability,
+            'var_95': var_95,
+            'cvar_95': self.lower_tail.tail_mean(var_95),
+            'var_99': var_99,
+            'cvar_99': self.lower_tail.tail_mean(var_99),
+            'asimetria': self.npv.skewness,
+            'curtosis': self.npv.kurtosis,
+            'percentil_10': quantiles[0],
+            'percentil_25': quantiles[1],
+            'mediana': quantiles[2],
+            'percentil_75': quantiles[3],
+            'percentil_90': quantiles[4],
+            'roi_medio': self.roi.mean,
+            'roi_std': self.roi.std,
+            'roi_min': self.roi.min,
+            'roi_max': self.roi.max,
+            'prob_roi_positivo': self.positive_roi / n * 100,
+        }
+        metrics.update(break_even_metrics(self.break_even_counts))
+        return metrics
+
+
+def break_even_metrics(counts: np.ndarray) -> Dict:
+    """Métricas de break-even a partir del conteo de trayectorias por mes (np.bincount)"""
+    n = counts.sum()
+    months = np.arange(counts.size)
+    cumulative = np.cumsum(counts)
+    median = (months[np.searchsorted(cumulative, (n - 1) // 2, side='right')]
+              + months[np.searchsorted(cumulative, n // 2, side='right')]) / 2
+    return {
+        'break_even_medio': float(months @ counts) / n,
+        'break_even_mediano': median,
+        'prob_break_even_6m': counts[:7].sum() / n * 100,
+        'prob_break_even_12m': counts[:13].sum() / n * 100,
+    }
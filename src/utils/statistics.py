@@ -1,16 +1,43 @@
 import numpy as np
-import pandas as pd
-from typing import Dict, List
+from dataclasses import replace
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
 from ..models.business_scenario import SimulationResult
+from ..simulation.samplers import _make_sobol
+from .online_stats import RunningMoments, break_even_metrics
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 class StatisticsCalculator:
     """Calculadora de estadísticas avanzadas para análisis de riesgo"""
     
     @staticmethod
     def calculate_risk_metrics(result: SimulationResult) -> Dict:
-        """Calcula métricas de riesgo empresarial"""
+        """Calcula métricas de riesgo empresarial
+        
+        Se calculan una sola vez y quedan guardadas en result.risk_metrics, así la
+        persistencia del motor, los callbacks de la UI y compare_scenarios comparten
+        el mismo diccionario (tratarlo como de solo lectura).
+        """
+        
+        if result.risk_metrics is None:
+            if result.weights is not None:
+                result.risk_metrics = StatisticsCalculator._weighted_risk_metrics(result)
+            else:
+                result.risk_metrics = StatisticsCalculator._unweighted_risk_metrics(result)
+        return result.risk_metrics
+    
+    @staticmethod
+    def _unweighted_risk_metrics(result: SimulationResult) -> Dict:
+        """Métricas de riesgo a partir de las trayectorias sin pesos"""
         
+        # Una sola ordenación del NPV sirve para todos los percentiles y las colas (VaR/CVaR)
         npv_values = result.net_present_values
+        sorted_npv = np.sort(npv_values)
+        var_99, p10, p25, p50, p75, p90 = StatisticsCalculator.sorted_percentiles(
+            sorted_npv, [1, 10, 25, 50, 75, 90])
+        npv_moments = RunningMoments()
+        npv_moments.update(npv_values)
         
         # Métricas básicas
         metrics = {
@@ -19,49 +46,196 @@ class StatisticsCalculator:
             'coeficiente_variacion': result.std_npv / abs(result.mean_npv) if result.mean_npv != 0 else float('inf'),
             'probabilidad_exito': result.success_probability,
             'var_95': result.var_95,
-            'cvar_95': np.mean(npv_values[npv_values <= result.var_95]),  # Conditional VaR
+            'cvar_95': StatisticsCalculator._sorted_tail_mean(sorted_npv, result.var_95),  # Conditional VaR
+            'var_99': var_99,
+            'cvar_99': StatisticsCalculator._sorted_tail_mean(sorted_npv, var_99),
         }
         
         # Métricas de distribución
         metrics.update({
-            'asimetria': float(pd.Series(npv_values).skew()),
-            'curtosis': float(pd.Series(npv_values).kurtosis()),
-            'percentil_10': np.percentile(npv_values, 10),
-            'percentil_25': np.percentile(npv_values, 25),
-            'mediana': np.percentile(npv_values, 50),
-            'percentil_75': np.percentile(npv_values, 75),
-            'percentil_90': np.percentile(npv_values, 90),
+            'asimetria': npv_moments.skewness,
+            'curtosis': npv_moments.kurtosis,
+            'percentil_10': p10,
+            'percentil_25': p25,
+            'mediana': p50,
+            'percentil_75': p75,
+            'percentil_90': p90,
         })
         
         # Métricas de ROI
         roi_values = result.roi_values
+        roi_moments = RunningMoments()
+        roi_moments.update(roi_values)
+        metrics.update({
+            'roi_medio': roi_moments.mean,
+            'roi_std': roi_moments.std,
+            'roi_min': roi_moments.min,
+            'roi_max': roi_moments.max,
+            'prob_roi_positivo': np.count_nonzero(roi_values > 0) / roi_values.size * 100,
+        })
+        
+        # Análisis de break-even (meses enteros: basta un conteo por mes)
+        metrics.update(break_even_metrics(np.bincount(np.asarray(result.break_even_months, dtype=np.int64))))
+        
+        return metrics
+    
+    @staticmethod
+    def _weighted_risk_metrics(result: SimulationResult) -> Dict:
+        """Métricas de riesgo con pesos de muestreo por importancia (estimadores autonormalizados)"""
+        
+        calc = StatisticsCalculator
+        weights = result.weights / result.weights.sum()
+        npv_values = result.net_present_values
+        
+        centered = npv_values - result.mean_npv
+        variance = np.sum(weights * centered**2)
+        quantiles = calc.weighted_quantile(npv_values, weights, [0.10, 0.25, 0.50, 0.75, 0.90])
+        
+        metrics = {
+            'media_npv': result.mean_npv,
+            'desviacion_std': result.std_npv,
+            'coeficiente_variacion': result.std_npv / abs(result.mean_npv) if result.mean_npv != 0 else float('inf'),
+            'probabilidad_exito': result.success_probability,
+            'var_95': result.var_95,
+            'cvar_95': calc.weighted_cvar(npv_values, weights, 0.05),
+            'var_99': calc.weighted_var(npv_values, weights, 0.01),
+            'cvar_99': calc.weighted_cvar(npv_values, weights, 0.01),
+            'asimetria': np.sum(weights * centered**3) / variance**1.5 if variance > 0 else 0.0,
+            'curtosis': np.sum(weights * centered**4) / variance**2 - 3 if variance > 0 else 0.0,
+            'percentil_10': quantiles[0],
+            'percentil_25': quantiles[1],
+            'mediana': quantiles[2],
+            'percentil_75': quantiles[3],
+            'percentil_90': quantiles[4],
+        }
+        
+        roi_values = result.roi_values
+        roi_mean = np.sum(weights * roi_values)
         metrics.update({
-            'roi_medio': np.mean(roi_values),
-            'roi_std': np.std(roi_values),
+            'roi_medio': roi_mean,
+            'roi_std': np.sqrt(np.sum(weights * (roi_values - roi_mean)**2)),
             'roi_min': np.min(roi_values),
             'roi_max': np.max(roi_values),
-            'prob_roi_positivo': np.mean(roi_values > 0) * 100,
+            'prob_roi_positivo': np.sum(weights[roi_values > 0]) * 100,
         })
         
-        # Análisis de break-even
         break_even = result.break_even_months
         metrics.update({
-            'break_even_medio': np.mean(break_even),
-            'break_even_mediano': np.median(break_even),
-            'prob_break_even_6m': np.mean(break_even <= 6) * 100,
-            'prob_break_even_12m': np.mean(break_even <= 12) * 100,
+            'break_even_medio': np.sum(weights * break_even),
+            'break_even_mediano': calc.weighted_quantile(break_even, weights, 0.5),
+            'prob_break_even_6m': np.sum(weights[break_even <= 6]) * 100,
+            'prob_break_even_12m': np.sum(weights[break_even <= 12]) * 100,
         })
         
         return metrics
     
     @staticmethod
-    def compare_scenarios(results: List[SimulationResult]) -> pd.DataFrame:
+    def sorted_percentiles(sorted_values: np.ndarray, q) -> np.ndarray:
+        """Percentiles (0-100) de valores ya ordenados, con la interpolación lineal de np.percentile"""
+        last = len(sorted_values) - 1
+        positions = np.asarray(q, dtype=float) / 100 * last
+        lower = np.floor(positions).astype(np.int64)
+        upper = np.minimum(lower + 1, last)
+        fraction = positions - lower
+        return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * fraction
+    
+    @staticmethod
+    def _sorted_tail_mean(sorted_values: np.ndarray, threshold: float) -> float:
+        """Media de los valores menores o iguales al umbral sobre valores ya ordenados"""
+        count = int(np.searchsorted(sorted_values, threshold, side='right'))
+        return sorted_values[:count].mean() if count else float('nan')
+    
+    @staticmethod
+    def weighted_quantile(values: np.ndarray, weights: Optional[np.ndarray], q):
+        """Cuantil (0-1) de la distribución empírica ponderada: inf{x : F(x) >= q}"""
+        if weights is None:
+            weights = np.ones(len(values))
+        order = np.argsort(values)
+        cumulative = np.cumsum(weights[order])
+        cumulative /= cumulative[-1]
+        index = np.minimum(np.searchsorted(cumulative, q, side='left'), len(values) - 1)
+        return values[order][index]
+    
+    @staticmethod
+    def weighted_var(values: np.ndarray, weights: Optional[np.ndarray] = None, alpha: float = 0.05) -> float:
+        """Value at Risk al nivel 1 - alpha con pesos de muestreo por importancia"""
+        return float(StatisticsCalculator.weighted_quantile(values, weights, alpha))
+    
+    @staticmethod
+    def weighted_cvar(values: np.ndarray, weights: Optional[np.ndarray] = None, alpha: float = 0.05) -> float:
+        """Conditional VaR: valor esperado en la peor fracción alpha, con pesos de muestreo
+        
+        Si el VaR cae dentro de un átomo de probabilidad, solo se toma la parte del
+        átomo necesaria para completar alpha.
+        """
+        if weights is None:
+            weights = np.ones(len(values))
+        order = np.argsort(values)
+        sorted_values = values[order]
+        probabilities = weights[order] / np.sum(weights)
+        cumulative = np.cumsum(probabilities)
+        index = min(int(np.searchsorted(cumulative, alpha, side='left')), len(values) - 1)
+        below = cumulative[index - 1] if index > 0 else 0.0
+        tail = np.sum(probabilities[:index] * sorted_values[:index]) + (alpha - below) * sorted_values[index]
+        return float(tail / alpha)
+    
+    @staticmethod
+    def histogram(values: np.ndarray, weights: Optional[np.ndarray] = None, bins: int = 50,
+                  kde_points: int = 256) -> Dict:
+        """Histograma de intervalos fijos con curva KDE gaussiana en la misma escala
+        
+        Resume la distribución en bins frecuencias y kde_points puntos de densidad,
+        sea cual sea el número de trayectorias, para graficarla sin enviar el array.
+        Con pesos de muestreo por importancia las frecuencias se reescalan para
+        sumar el número de trayectorias. La KDE usa el ancho de banda de Silverman
+        y se calcula por convolución sobre una rejilla de kde_points intervalos.
+        """
+        values = np.asarray(values, dtype=float)
+        n = len(values)
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float) * (n / np.sum(weights))
+        low, high = float(values.min()), float(values.max())
+        if high <= low:
+            low, high = low - 0.5, high + 0.5
+        edges = np.linspace(low, high, bins + 1)
+        counts = np.histogram(values, bins=edges, weights=weights)[0]
+        
+        # Ancho de banda de Silverman con el tamaño de muestra efectivo
+        effective_n = n if weights is None else np.sum(weights)**2 / np.sum(weights**2)
+        mean = np.average(values, weights=weights)
+        std = np.sqrt(np.average((values - mean)**2, weights=weights))
+        if weights is None:
+            q25, q75 = np.percentile(values, [25, 75])
+        else:
+            q25, q75 = StatisticsCalculator.weighted_quantile(values, weights, [0.25, 0.75])
+        spread = min(std, (q75 - q25) / 1.34) or std
+        bandwidth = 0.9 * spread * effective_n**-0.2 if spread > 0 else (high - low) / bins
+        
+        grid = np.linspace(low - 3 * bandwidth, high + 3 * bandwidth, kde_points)
+        step = grid[1] - grid[0]
+        grid_counts = np.histogram(values, bins=kde_points, range=(grid[0] - step / 2, grid[-1] + step / 2),
+                                   weights=weights)[0]
+        offsets = np.arange(1 - kde_points, kde_points) * step
+        kernel = np.exp(-0.5 * (offsets / bandwidth)**2) / (bandwidth * np.sqrt(2 * np.pi))
+        density = np.convolve(grid_counts, kernel, mode='valid')
+        
+        return {
+            'bordes': edges,
+            'frecuencias': counts,
+            'kde_x': grid,
+            'kde_y': density * (edges[1] - edges[0]),  # frecuencia esperada por intervalo
+        }
+    
+    @staticmethod
+    def compare_scenarios(results: List[SimulationResult]) -> 'pd.DataFrame':
         """Compara múltiples escenarios de negocio"""
         
+        import pandas as pd
+        
         comparison_data = []
         
         for result in results:
-            metrics = StatisticsCalculator.calculate_risk_metrics(result)
+            metrics = dict(StatisticsCalculator.calculate_risk_metrics(result))
             metrics['escenario'] = result.scenario_name
             comparison_data.append(metrics)
         
@@ -76,24 +250,30 @@ class StatisticsCalculator:
     
     @staticmethod
     def sensitivity_analysis(base_scenario, engine, parameter_ranges: Dict) -> Dict:
-        """Análisis de sensibilidad de parámetros"""
+        """Análisis de sensibilidad de parámetros
         
-        sensitivity_results = {}
+        Todos los puntos de la grilla se evalúan en una pasada vectorizada por
+        bloques sobre las mismas normales (números aleatorios comunes), así las
+        curvas solo reflejan el efecto del parámetro y no el ruido de muestreo.
+        No se guarda nada en base de datos.
+        """
         
+        grids = {}
+        scenarios = []
         for param, (min_val, max_val, steps) in parameter_ranges.items():
             param_values = np.linspace(min_val, max_val, steps)
-            npv_means = []
-            success_probs = []
-            
-            for value in param_values:
-                # Crear escenario modificado
-                scenario_copy = base_scenario.__class__(**base_scenario.__dict__)
-                setattr(scenario_copy, param, value)
-                
-                # Simular
-                result = engine.simulate_scenario(scenario_copy)
-                npv_means.append(result.mean_npv)
-                success_probs.append(result.success_probability)
+            if param == 'time_horizon':
+                param_values = np.round(param_values).astype(int)
+            grids[param] = (param_values, len(scenarios))
+            scenarios.extend(replace(base_scenario, **{param: value.item()}) for value in param_values)
+        
+        npv_means_all, success_probs_all = engine.summarize_common(scenarios)
+        
+        sensitivity_results = {}
+        
+        for param, (param_values, offset) in grids.items():
+            npv_means = list(npv_means_all[offset:offset + len(param_values)])
+            success_probs = list(success_probs_all[offset:offset + len(param_values)])
             
             sensitivity_results[param] = {
                 'values': param_values,
@@ -102,4 +282,60 @@ class StatisticsCalculator:
                 'elasticity_npv': np.std(npv_means) / np.mean(npv_means) if np.mean(npv_means) != 0 else 0
             }
         
-        return sensitivity_results
\ No newline at end of file
+        return sensitivity_results
+    
+    @staticmethod
+    def sobol_sensitivity(base_scenario, engine, parameter_bounds: Dict[str, Tuple[float, float]],
+                          n_samples: int = 512, seed: Optional[int] = None,
+                          progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """Índices de Sobol de primer orden y efecto total (diseño de Saltelli)
+        
+        Se generan dos matrices A y B de n_samples puntos (Sobol aleatorizado) dentro
+        de parameter_bounds y, para cada parámetro i, la matriz A_B^i (A con la
+        columna i de B): n_samples·(d+2) simulaciones completas. Todas usan las
+        mismas normales y se evalúan por lotes con engine.evaluate_parameter_sets,
+        en paralelo si el motor tiene workers > 1. Se usan los estimadores de
+        Saltelli (2010) para el primer orden y de Jansen para el efecto total,
+        tanto del NPV medio como de la probabilidad de éxito.
+        """
+        names = list(parameter_bounds)
+        n_params = len(names)
+        lower = np.array([parameter_bounds[name][0] for name in names], dtype=float)
+        upper = np.array([parameter_bounds[name][1] for name in names], dtype=float)
+        
+        sampler = _make_sobol(2 * n_params, seed)
+        points = lower + sampler.random(n_samples).reshape(n_samples, 2, n_params) * (upper - lower)
+        matrix_a, matrix_b = points[:, 0], points[:, 1]
+        
+        # Filas: A, B y luego A_B^i para cada parámetro
+        design = [matrix_a, matrix_b]
+        for i in range(n_params):
+            matrix_ab = matrix_a.copy()
+            matrix_ab[:, i] = matrix_b[:, i]
+            design.append(matrix_ab)
+        design = np.concatenate(design)
+        
+        def as_value(name, value):
+            return int(round(value)) if name == 'time_horizon' else float(value)
+        
+        parameter_sets = [{name: as_value(name, value) for name, value in zip(names, row)} for row in design]
+        outputs = engine.evaluate_parameter_sets(base_scenario, parameter_sets, seed,
+                                                 progress_callback=progress_callback)
+        
+        results = {name: {} for name in names}
+        for label, values in zip(('npv', 'success'), outputs):
+            blocks = values.reshape(n_params + 2, n_samples)
+            f_a, f_b = blocks[0], blocks[1]
+            variance = np.var(np.concatenate([f_a, f_b]))
+            for i, name in enumerate(names):
+                f_ab = blocks[2 + i]
+                if variance > 0:
+                    first_order = np.mean(f_b * (f_ab - f_a)) / variance
+                    total_effect = 0.5 * np.mean((f_a - f_ab) ** 2) / variance
+                else:
+                    first_order = total_effect = 0.0
+                results[name][f'first_order_{label}'] = first_order
+                results[name][f'total_effect_{label}'] = total_effect
+        
+        results['n_evaluations'] = len(parameter_sets)
+        return results
@@ -1,4 +1,5 @@
 import unittest
+import psycopg2
 import numpy as np
 import sys
 import os
@@ -6,7 +7,14 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.models.business_scenario import BusinessScenario
 from src.simulation.monte_carlo_engine import MonteCarloEngine
+from src.simulation.cache import ResultCache
+from src.simulation.jobs import SimulationJobManager
+from src.simulation.service import SimulationService
+from src.api.simulation_api import register_simulation_api
+from src.database.array_codec import decode_arrays, encode_arrays
+from src.database.write_queue import WriteBehindQueue
 from src.utils.statistics import StatisticsCalculator
+from src.utils.online_stats import StreamingAggregator
 
 class TestMonteCarloEngine(unittest.TestCase):
     """Pruebas unitarias para el motor Monte Carlo"""
@@ -67,6 +75,635 @@ class TestMonteCarloEngine(unittest.TestCase):
         
         # VaR debe ser menor o igual que el percentil 5
         self.assertLessEqual(metrics['var_95'], result.percentile_5)
+    
+    def test_single_pass_metrics_match_reference(self):
+        """Prueba que las métricas de una sola pasada coinciden con numpy y pandas"""
+        import pandas as pd
+        result = self.engine.simulate_scenario(self.test_scenario)
+        metrics = StatisticsCalculator.calculate_risk_metrics(result)
+        npv_values = result.net_present_values
+        break_even = result.break_even_months
+        
+        expected = {
+            'asimetria': pd.Series(npv_values).skew(),
+            'curtosis': pd.Series(npv_values).kurtosis(),
+            'percentil_10': np.percentile(npv_values, 10),
+            'mediana': np.percentile(npv_values, 50),
+            'percentil_90': np.percentile(npv_values, 90),
+            'var_99': np.percentile(npv_values, 1),
+            'cvar_95': np.mean(npv_values[npv_values <= result.var_95]),
+            'roi_std': np.std(result.roi_values),
+            'break_even_medio': np.mean(break_even),
+            'break_even_mediano': np.median(break_even),
+            'prob_break_even_12m': np.mean(break_even <= 12) * 100,
+        }
+        for key, value in expected.items():
+            self.assertAlmostEqual(metrics[key], value, delta=1e-9 * max(1.0, abs(value)), msg=key)
+    
+    def test_metrics_cached_on_result(self):
+        """Prueba que las métricas se calculan una vez y compare_scenarios no las altera"""
+        result = self.engine.simulate_scenario(self.test_scenario)
+        metrics = StatisticsCalculator.calculate_risk_metrics(result)
+        
+        self.assertIs(result.risk_metrics, metrics)
+        self.assertIs(StatisticsCalculator.calculate_risk_metrics(result), metrics)
+        comparison = StatisticsCalculator.compare_scenarios([result])
+        self.assertNotIn('escenario', metrics)
+        self.assertEqual(comparison.loc['Test Scenario', 'media_npv'], metrics['media_npv'])
+    
+    def test_result_cache(self):
+        """Prueba la caché en memoria, su expulsión por tamaño y el nivel en disco"""
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            engine = MonteCarloEngine(n_simulations=1000, use_database=False,
+                                      cache=ResultCache(directory=directory))
+            result = engine.simulate_scenario(self.test_scenario)
+            self.assertIs(engine.simulate_scenario(self.test_scenario), result)
+            # Sin seed con caché se usa la semilla del motor
+            fresh = MonteCarloEngine(n_simulations=1000, use_database=False)
+            self.assertEqual(fresh.simulate_scenario(self.test_scenario, seed=42).mean_npv, result.mean_npv)
+            self.assertIsNot(engine.simulate_scenario(self.test_scenario, seed=7), result)
+            # Enteros, float y escalares de numpy con el mismo valor comparten entrada
+            as_floats = BusinessScenario("Test Scenario", 50000.0, 15000.0, 3000.0, 8000.0, 1500.0,
+                                         inflation_rate=0.03, market_volatility=np.float64(0.15))
+            self.assertIs(engine.simulate_scenario(as_floats, seed=np.int64(42)), result)
+            self.assertNotEqual(ResultCache.make_key(self.test_scenario, 1000, 2**62, {}),
+                                ResultCache.make_key(self.test_scenario, 1000, 2**62 + 1, {}))
+            
+            # Otro proceso con caché vacía en memoria lee el archivo .npz
+            other = MonteCarloEngine(n_simulations=1000, use_database=False,
+                                     cache=ResultCache(directory=directory))
+            loaded = other.simulate_scenario(self.test_scenario)
+            self.assertEqual(loaded.mean_npv, result.mean_npv)
+            np.testing.assert_array_equal(loaded.net_present_values, result.net_present_values)
+        
+        small = ResultCache(max_bytes=2 * result.net_present_values.nbytes * 3 - 1)
+        small.put('a', result)
+        small.put('b', result)
+        self.assertIsNone(small.get('a'))
+        self.assertIs(small.get('b'), result)
+    
+    def test_array_codec_roundtrip(self):
+        """Prueba el formato binario de trayectorias con y sin compresión"""
+        result = self.engine.simulate_scenario(self.test_scenario)
+        arrays = {'npv_values': result.net_present_values,
+                  'break_even_months': result.break_even_months.astype(np.uint8)}
+        
+        for compression in ('zlib', 'none'):
+            payload, metadata = encode_arrays(arrays, compression)
+            decoded = decode_arrays(memoryview(payload), metadata)
+            np.testing.assert_array_equal(decoded['npv_values'], result.net_present_values)
+            np.testing.assert_array_equal(decoded['break_even_months'], result.break_even_months)
+            self.assertEqual(decoded['break_even_months'].dtype, np.uint8)
+        
+        self.assertLess(len(payload), len(str(result.net_present_values.tolist())))
+        with self.assertRaises(ValueError):
+            encode_arrays(arrays, 'lz4')
+    
+    def test_save_runs_rows_match_columns(self):
+        """Prueba que las filas de save_runs siguen la plantilla y el orden de columnas del SQL"""
+        import json
+        from contextlib import contextmanager
+        from unittest import mock
+        from src.database import neon_db
+        
+        db = neon_db.NeonDB.__new__(neon_db.NeonDB)
+        
+        @contextmanager
+        def fake_connection():
+            yield mock.MagicMock()
+        
+        columns = neon_db.SCENARIO_COLUMNS + neon_db.RESULT_COLUMNS
+        self.assertIn(f"(position, {', '.join(columns)})", neon_db.SAVE_RUNS_SQL)
+        self.assertEqual(neon_db.SAVE_RUNS_TEMPLATE.count('%s'), 19)
+        
+        engine = MonteCarloEngine(n_simulations=200, use_database=False)
+        other = BusinessScenario("Otro", 60000, 15000, 3000, 8000, 1500, time_horizon=24)
+        runs = [(scenario, result, StatisticsCalculator.calculate_risk_metrics(result))
+                for scenario, result in ((self.test_scenario, engine.simulate_scenario(self.test_scenario)),
+                                         (other, engine.simulate_scenario(other)))]
+        with mock.patch.object(db, 'connection', fake_connection), \
+             mock.patch.object(neon_db.psycopg2.extras, 'execute_values', return_value=[(7,), (8,)]) as execute:
+            self.assertEqual(db.save_runs(runs), [7, 8])
+        
+        _, sql, rows = execute.call_args.args
+        self.assertEqual(sql, neon_db.SAVE_RUNS_SQL)
+        self.assertEqual(execute.call_args.kwargs['template'], neon_db.SAVE_RUNS_TEMPLATE)
+        for position, (row, (scenario, result, metrics)) in enumerate(zip(rows, runs)):
+            self.assertEqual(len(row), 19)
+            values = dict(zip(('position',) + columns, row))
+            self.assertEqual(values['position'], position)
+            for name in neon_db.SCENARIO_COLUMNS:
+                self.assertEqual(values[name], getattr(scenario, name))
+            self.assertEqual(values['mean_npv'], result.mean_npv)
+            self.assertEqual(values['var_95'], result.var_95)
+            self.assertEqual(values['roi_mean'], metrics['roi_medio'])
+            self.assertEqual(values['break_even_mean'], metrics['break_even_medio'])
+            self.assertEqual(json.loads(values['results_data'])['metrics']['media_npv'], metrics['media_npv'])
+            arrays = decode_arrays(bytes(values['arrays_data'].adapted), json.loads(values['arrays_meta']))
+            np.testing.assert_allclose(arrays['npv_values'], result.net_present_values, rtol=1e-6)
+
+    def test_connection_pool_reuses_idle(self):
+        """Prueba que el pool conserva abiertas las conexiones devueltas tras checkouts concurrentes"""
+        from unittest import mock
+        from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+        from src.database import pool
+
+        def connect(dsn):
+            conn = mock.MagicMock(closed=0)
+            conn.info.transaction_status = TRANSACTION_STATUS_IDLE
+            return conn
+
+        blocking = pool._BlockingPool("postgresql://test")
+        with mock.patch.object(pool.psycopg2, 'connect', side_effect=connect) as opened:
+            first = blocking.getconn()
+            second = blocking.getconn()
+            blocking.putconn(first)
+            blocking.putconn(second)
+            again = [blocking.getconn(), blocking.getconn()]
+            self.assertEqual(opened.call_count, 2)
+            self.assertEqual({id(conn) for conn in again}, {id(first), id(second)})
+            for conn in (first, second):
+                conn.close.assert_not_called()
+            for conn in again:
+                blocking.putconn(conn)
+        blocking.closeall()
+        first.close.assert_called_once()
+        second.close.assert_called_once()
+
+    def test_write_behind_queue(self):
+        """Prueba que la cola de escritura agrupa, reintenta y se vacía con flush"""
+        class FlakyStore:
+            def __init__(self):
+                self.calls = 0
+                self.saved = []
+            
+            def save_runs(self, runs):
+                self.calls += 1
+                if self.calls == 1:
+                    raise ConnectionError("conexión perdida")
+                self.saved.extend(runs)
+        
+        store = FlakyStore()
+        writer = WriteBehindQueue(store, backoff=0.001)
+        for index in range(10):
+            writer.submit(f"escenario {index}", None, {})
+        
+        self.assertTrue(writer.flush(timeout=5))
+        metrics = writer.metrics()
+        writer.close()
+        self.assertEqual([run[0] for run in store.saved], [f"escenario {index}" for index in range(10)])
+        self.assertEqual(metrics['depth'], 0)
+        self.assertEqual(metrics['written'], 10)
+        self.assertGreaterEqual(metrics['retries'], 1)
+        self.assertEqual(metrics['failed'], 0)
+        
+        # Un dato inválido no se reintenta ni arrastra al resto del lote
+        class StrictStore:
+            def __init__(self):
+                self.saved = []
+            
+            def save_runs(self, runs):  # todo o nada, como la transacción real
+                if any(run[0] == "malo" for run in runs):
+                    raise psycopg2.DataError("valor demasiado largo")
+                self.saved.extend(run[0] for run in runs)
+            
+            def save_run(self, scenario, result, metrics):
+                if scenario == "malo":
+                    raise psycopg2.DataError("valor demasiado largo")
+                self.saved.append(scenario)
+        
+        store = StrictStore()
+        writer = WriteBehindQueue(store, backoff=10)
+        for scenario in ("a", "malo", "b"):
+            writer.submit(scenario, None, {})
+        self.assertTrue(writer.flush(timeout=5))
+        metrics = writer.metrics()
+        writer.close()
+        self.assertEqual(store.saved, ["a", "b"])
+        self.assertEqual((metrics['written'], metrics['failed'], metrics['retries']), (2, 1, 0))
+    
+    def test_background_jobs(self):
+        """Prueba los trabajos en segundo plano: avance, resultado, caché y cancelación"""
+        import time
+        engine = MonteCarloEngine(n_simulations=4000, use_database=False, cache=ResultCache())
+        jobs = SimulationJobManager(engine, max_workers=1)
+        try:
+            job_id = jobs.submit(self.test_scenario)
+            status = jobs.status(job_id)
+            while not status.done:
+                time.sleep(0.05)
+                status = jobs.status(job_id)
+            
+            self.assertEqual(status.state, 'done')
+            self.assertEqual(status.completed, 4000)
+            expected = MonteCarloEngine(n_simulations=4000, use_database=False).simulate_scenario(
+                self.test_scenario, seed=engine.seed)
+            self.assertEqual(status.result.mean_npv, expected.mean_npv)
+            # El mismo escenario se sirve desde la caché sin volver a simular
+            deadline = time.time() + 5
+            while not len(engine.cache) and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertIs(jobs.status(jobs.submit(self.test_scenario)).result, status.result)
+            
+            # Un on_complete lento (p. ej. guardar en base de datos) no retrasa el estado 'done'
+            completed = []
+            slow_id = jobs.submit(BusinessScenario("Lento", 50000, 12000, 2000, 7000, 1000),
+                                  on_complete=lambda result: (time.sleep(1), completed.append(result)))
+            while not jobs.status(slow_id).done:
+                time.sleep(0.02)
+            self.assertEqual(jobs.status(slow_id).state, 'done')
+            self.assertEqual(completed, [])
+            
+            other = BusinessScenario("Otro", 60000, 15000, 3000, 8000, 1500)
+            cancelled_id = jobs.submit(other)
+            self.assertTrue(jobs.cancel(cancelled_id))
+            deadline = time.time() + 10
+            while not jobs.status(cancelled_id).done and time.time() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(jobs.status(cancelled_id).state, 'cancelled')
+            self.assertFalse(jobs.cancel(job_id))
+        finally:
+            jobs.shutdown()
+    
+    def test_partial_snapshots(self):
+        """Prueba las estimaciones parciales publicadas por bloque durante la simulación"""
+        engine = MonteCarloEngine(n_simulations=6000, use_database=False)
+        engine.batch_size = 1000
+        aggregator = StreamingAggregator(6000, self.test_scenario.time_horizon, histogram_bins=40)
+        snapshots = []
+        
+        def report(block):
+            aggregator.update(*block[:3])
+            snapshots.append(aggregator.snapshot())
+        
+        engine.progress_callback = report
+        result = engine.simulate_scenario(self.test_scenario, seed=7)
+        
+        self.assertEqual([s['completed'] for s in snapshots], list(range(1000, 6001, 1000)))
+        first, last = snapshots[0], snapshots[-1]
+        self.assertGreater(first['media_npv_ic'], last['media_npv_ic'])
+        self.assertLess(abs(first['media_npv'] - result.mean_npv), first['media_npv_ic'] * 2)
+        self.assertAlmostEqual(last['media_npv'], result.mean_npv, places=4)
+        self.assertAlmostEqual(last['probabilidad_exito'], result.success_probability)
+        self.assertEqual(sum(last['histograma']['frecuencias']), 6000)
+        self.assertEqual(len(last['histograma']['bordes']), 41)
+    
+    def test_server_side_histogram(self):
+        """Prueba el histograma agrupado en el servidor y su curva KDE"""
+        values = np.random.default_rng(3).normal(1000, 200, 20000)
+        histogram = StatisticsCalculator.histogram(values, bins=40, kde_points=128)
+        
+        self.assertEqual(len(histogram['bordes']), 41)
+        self.assertEqual(histogram['frecuencias'].sum(), 20000)
+        self.assertEqual(len(histogram['kde_y']), 128)
+        # La KDE está en la escala de las frecuencias por intervalo
+        bin_width = histogram['bordes'][1] - histogram['bordes'][0]
+        kde_step = histogram['kde_x'][1] - histogram['kde_x'][0]
+        self.assertAlmostEqual(histogram['kde_y'].sum() * kde_step / bin_width, 20000, delta=200)
+        centers = (histogram['bordes'][:-1] + histogram['bordes'][1:]) / 2
+        peak = np.interp(1000, histogram['kde_x'], histogram['kde_y'])
+        self.assertAlmostEqual(peak, histogram['frecuencias'][np.argmin(abs(centers - 1000))], delta=peak * 0.1)
+        
+        weighted = StatisticsCalculator.histogram(values, weights=np.full(20000, 0.5), bins=40, kde_points=128)
+        np.testing.assert_allclose(weighted['frecuencias'], histogram['frecuencias'])
+    
+    def test_simulation_service(self):
+        """Prueba la capa de simulación compartida: escenarios de formulario, caché y métricas"""
+        from unittest import mock
+        service = SimulationService(n_simulations=2000, cache=ResultCache(), use_database=False)
+        try:
+            scenario = service.build_scenario("Formulario", None, 30000, '', market_volatility=None)
+            self.assertEqual(scenario.initial_investment, 100000)
+            self.assertEqual(scenario.revenue_mean, 30000)
+            self.assertEqual(scenario.revenue_std, 5000)
+            self.assertEqual(scenario.market_volatility, 0.15)
+            
+            result = service.simulate(scenario)
+            self.assertIs(service.simulate(scenario), result)
+            self.assertEqual(service.cache.hits, 1)
+            self.assertIs(service.metrics(result), service.metrics(result))
+            
+            # El lote sirve los escenarios cacheados y simula el resto en una sola pasada
+            other = service.build_scenario("Otro", 60000, 20000, time_horizon=24)
+            with mock.patch.object(service.engine, 'simulate_many', wraps=service.engine.simulate_many) as many:
+                batch = service.simulate_many([scenario, other, other])
+                self.assertIs(service.simulate_many([other])[0], batch[1])
+            self.assertEqual(many.call_count, 1)
+            self.assertEqual(many.call_args.args[0], [other])
+            self.assertIs(batch[0], result)
+            self.assertIs(batch[2], batch[1])
+            single = MonteCarloEngine(n_simulations=2000, use_database=False).simulate_scenario(other)
+            np.testing.assert_allclose(batch[1].net_present_values, single.net_present_values)
+            self.assertAlmostEqual(batch[1].mean_npv, single.mean_npv, places=6)
+        finally:
+            service.shutdown()
+    
+    def test_simulation_api(self):
+        """Prueba la API JSON: simulación, lote, arrays comprimidos, gzip y errores"""
+        import gzip, json, base64
+        from flask import Flask
+        server = Flask(__name__)
+        service = SimulationService(n_simulations=2000, cache=ResultCache(), use_database=False)
+        register_simulation_api(server, service)
+        client = server.test_client()
+        scenario = {'name': 'API', 'initial_investment': 100000, 'revenue_mean': 25000,
+                    'revenue_std': 5000, 'cost_mean': 15000, 'cost_std': 3000}
+        try:
+            response = client.post('/api/simulate', json={'scenario': scenario, 'arrays': True},
+                                   headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            data = json.loads(gzip.decompress(response.data))
+            result = service.simulate(BusinessScenario(**scenario))
+            self.assertAlmostEqual(data['metrics']['media_npv'], result.mean_npv)
+            arrays = decode_arrays(base64.b64decode(data['arrays']['data']), data['arrays']['metadata'])
+            np.testing.assert_allclose(arrays['net_present_values'], result.net_present_values, rtol=1e-6)
+            
+            batch = client.post('/api/simulate/batch', json={'scenarios': [scenario, dict(scenario, name='B')]})
+            self.assertEqual([r['scenario'] for r in batch.get_json()['results']], ['API', 'B'])
+            self.assertNotIn('Content-Encoding', batch.headers)
+            
+            missing = client.post('/api/simulate', json={'scenario': {'name': 'X'}})
+            self.assertEqual(missing.status_code, 400)
+            self.assertIn('Faltan campos', missing.get_json()['error'])
+            self.assertEqual(client.post('/api/simulate', data='{').status_code, 400)
+            for invalid in ({'time_horizon': 10**6}, {'name': 'x' * 256}, {'revenue_std': -1}):
+                response = client.post('/api/simulate', json={'scenario': dict(scenario, **invalid)})
+                self.assertEqual(response.status_code, 400, invalid)
+            self.assertEqual(client.post('/api/simulate', data=b' ' * (2 * 1024 * 1024)).status_code, 413)
+            self.assertEqual(client.post('/api/simulate/batch', json={'scenarios': [scenario] * 101}).status_code, 413)
+        finally:
+            service.shutdown()
+    
+    def test_vectorized_matches_path_loop(self):
+        """Prueba que el kernel vectorizado reproduce el bucle por trayectoria con la misma semilla"""
+        engine = MonteCarloEngine(n_simulations=300, use_database=False)
+        engine.batch_size = 128
+        npv_values, _, _ = engine._simulate_paths(self.test_scenario, 300, np.random.RandomState(42))
+        
+        random_state = np.random.RandomState(42)
+        scenario = self.test_scenario
+        horizon = scenario.time_horizon
+        expected = []
+        for _ in range(300):
+            revenues = random_state.normal(scenario.revenue_mean, scenario.revenue_std, horizon)
+            growth = np.array([1 + 0.02 * t for t in range(horizon)])
+            shocks = random_state.normal(1, scenario.market_volatility, horizon)
+            revenues = np.maximum(revenues * growth * shocks, 0)
+            costs = np.maximum(random_state.normal(scenario.cost_mean, scenario.cost_std, horizon), 0)
+            inflation = random_state.normal(scenario.inflation_rate, 0.01, horizon)
+            factors = np.array([1 - sum(inflation[:t+1])/12 for t in range(horizon)])
+            cash_flows = (revenues - costs) * factors
+            discount = np.array([1/(1+0.1)**(t/12) for t in range(horizon)])
+            expected.append(np.sum(cash_flows * discount) - scenario.initial_investment)
+        
+        np.testing.assert_allclose(npv_values, expected, rtol=1e-10)
+    
+    def test_compound_inflation_factors(self):
+        """Prueba el modelo de inflación compuesta frente al producto explícito"""
+        engine = MonteCarloEngine(n_simulations=10, use_database=False, inflation_model='compound')
+        normals = np.random.standard_normal((5, self.test_scenario.time_horizon))
+        factors = engine._generate_inflation_factors(self.test_scenario, normals)
+        
+        shocks = self.test_scenario.inflation_rate + 0.01 * normals
+        expected = np.cumprod(1 / (1 + shocks / 12), axis=1)
+        np.testing.assert_allclose(factors, expected, rtol=1e-12)
+        
+        with self.assertRaises(ValueError):
+            MonteCarloEngine(use_database=False, inflation_model='exponencial')
+    
+    def test_parallel_simulation_reproducible(self):
+        """Prueba que la simulación multiproceso es reproducible para una semilla y workers dados"""
+        first = MonteCarloEngine(n_simulations=1001, use_database=False, workers=2, seed=7)
+        second = MonteCarloEngine(n_simulations=1001, use_database=False, workers=2, seed=7)
+        result_a = first.simulate_scenario(self.test_scenario)
+        result_b = second.simulate_scenario(self.test_scenario)
+        
+        self.assertEqual(len(result_a.net_present_values), 1001)
+        np.testing.assert_array_equal(result_a.net_present_values, result_b.net_present_values)
+        np.testing.assert_array_equal(result_a.break_even_months, result_b.break_even_months)
+    
+    def test_engine_owned_generator(self):
+        """Prueba el Generator propio del motor y la semilla por llamada"""
+        engine = MonteCarloEngine(n_simulations=500, use_database=False, bit_generator='Philox')
+        first = engine.simulate_scenario(self.test_scenario, seed=123)
+        np.random.seed(0)  # El estado global no debe afectar al motor
+        second = engine.simulate_scenario(self.test_scenario, seed=123)
+        third = engine.simulate_scenario(self.test_scenario)
+        
+        np.testing.assert_array_equal(first.net_present_values, second.net_present_values)
+        self.assertFalse(np.array_equal(first.net_present_values, third.net_present_values))
+        
+        with self.assertRaises(ValueError):
+            MonteCarloEngine(use_database=False, bit_generator='Mersenne')
+    
+    def test_streaming_matches_batch(self):
+        """Prueba que la simulación por bloques reproduce las métricas exactas sin guardar arrays"""
+        engine = MonteCarloEngine(n_simulations=5000, use_database=False)
+        updates = list(engine.simulate_streaming(self.test_scenario, chunk_size=1500, seed=11))
+        streamed = updates[-1].result
+        batch = engine.simulate_scenario(self.test_scenario, seed=11)
+        
+        self.assertEqual([u.completed for u in updates], [1500, 3000, 4500, 5000])
+        self.assertTrue(updates[-1].done)
+        # Los parciales estiman con el t-digest; solo el final trae las métricas exactas
+        self.assertTrue(all(u.result.risk_metrics is None for u in updates[:-1]))
+        self.assertLess(abs(updates[-2].result.var_95 - batch.var_95), 0.05 * batch.std_npv)
+        self.assertEqual(len(streamed.net_present_values), 0)
+        self.assertAlmostEqual(streamed.mean_npv, batch.mean_npv, places=6)
+        self.assertAlmostEqual(streamed.std_npv, batch.std_npv, places=6)
+        self.assertAlmostEqual(streamed.var_95, batch.var_95, places=6)
+        self.assertAlmostEqual(streamed.percentile_95, batch.percentile_95, places=6)
+        self.assertEqual(streamed.success_probability, batch.success_probability)
+        
+        streamed_metrics = StatisticsCalculator.calculate_risk_metrics(streamed)
+        batch_metrics = StatisticsCalculator.calculate_risk_metrics(batch)
+        self.assertAlmostEqual(streamed_metrics['cvar_95'], batch_metrics['cvar_95'], places=6)
+        self.assertAlmostEqual(streamed_metrics['var_99'], batch_metrics['var_99'], places=6)
+        self.assertAlmostEqual(streamed_metrics['cvar_99'], batch_metrics['cvar_99'], places=6)
+        self.assertEqual(set(streamed_metrics), set(batch_metrics))
+        self.assertAlmostEqual(streamed_metrics['asimetria'], batch_metrics['asimetria'], places=6)
+        self.assertEqual(streamed_metrics['break_even_mediano'], batch_metrics['break_even_mediano'])
+        self.assertLess(abs(streamed_metrics['mediana'] - batch_metrics['mediana']), 0.01 * batch.std_npv)
+    
+    def test_adaptive_stopping(self):
+        """Prueba que el modo adaptativo se detiene al alcanzar la tolerancia"""
+        engine = MonteCarloEngine(n_simulations=1000, use_database=False)
+        result = engine.simulate_adaptive(self.test_scenario, npv_tolerance=500, batch_size=250, seed=3)
+        n_paths = len(result.net_present_values)
+        
+        self.assertLessEqual(result.std_error_npv, 500)
+        self.assertEqual(n_paths % 250, 0)
+        self.assertLess(n_paths, 1000000)
+        
+        capped = engine.simulate_adaptive(self.test_scenario, npv_tolerance=1e-6, batch_size=250,
+                                          max_simulations=600, seed=3)
+        self.assertEqual(len(capped.net_present_values), 600)
+        self.assertGreater(capped.std_error_npv, 1e-6)
+    
+    def test_variance_reduction(self):
+        """Prueba variables antitéticas y de control frente al Monte Carlo simple"""
+        plain = MonteCarloEngine(n_simulations=4000, use_database=False).simulate_scenario(
+            self.test_scenario, seed=5)
+        engine = MonteCarloEngine(n_simulations=4000, use_database=False,
+                                  antithetic=True, control_variate=True)
+        reduced = engine.simulate_scenario(self.test_scenario, seed=5)
+        
+        self.assertIsNone(plain.variance_reduction_factor)
+        self.assertGreater(reduced.variance_reduction_factor, 1)
+        self.assertLess(reduced.std_error_npv, plain.std_error_npv)
+        self.assertLess(abs(reduced.mean_npv - engine.analytic_expected_npv(self.test_scenario)),
+                        4 * plain.std_error_npv)
+    
+    def test_sobol_sampler_replicates(self):
+        """Prueba el muestreo QMC con réplicas aleatorizadas y sus barras de error"""
+        engine = MonteCarloEngine(n_simulations=4096, use_database=False, sampler='sobol', qmc_replicates=8)
+        first = engine.simulate_scenario(self.test_scenario, seed=2)
+        second = engine.simulate_scenario(self.test_scenario, seed=2)
+        plain = MonteCarloEngine(n_simulations=4096, use_database=False).simulate_scenario(
+            self.test_scenario, seed=2)
+        
+        np.testing.assert_array_equal(first.net_present_values, second.net_present_values)
+        self.assertTrue(np.all(np.isfinite(first.net_present_values)))
+        self.assertLess(first.std_error_npv, plain.std_error_npv)
+        self.assertGreater(first.variance_reduction_factor, 1)
+        
+        with self.assertRaises(ValueError):
+            MonteCarloEngine(use_database=False, sampler='halton')
+    
+    def test_sobol_blocks_without_balance_warning(self):
+        """Prueba que los bloques de tamaño arbitrario no rompen la secuencia ni avisan de balance"""
+        import warnings
+        from scipy.special import ndtri
+        from src.simulation.samplers import SobolSampler, _make_sobol
+        
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            engine = MonteCarloEngine(n_simulations=3000, use_database=False, sampler='sobol',
+                                      qmc_replicates=3, antithetic=True)
+            engine.batch_size = 700
+            result = engine.simulate_scenario(self.test_scenario, seed=5)
+            self.assertEqual(len(result.net_present_values), 3000)
+            
+            stream = SobolSampler().stream(np.random.default_rng(9), 3, 6)
+            blocks = np.concatenate([stream.normals(3), stream.normals(5), stream.normals(6)])
+        reference = _make_sobol(6, int(np.random.default_rng(9).integers(0, 2**63))).random(16)[:14]
+        np.testing.assert_allclose(blocks, ndtri(reference))
+    
+    def test_importance_sampling_tail_metrics(self):
+        """Prueba que el muestreo por importancia estima las colas con pesos correctos"""
+        reference = MonteCarloEngine(n_simulations=200000, use_database=False).simulate_scenario(
+            self.test_scenario, seed=4)
+        engine = MonteCarloEngine(n_simulations=20000, use_database=False, tail_tilt=0.2)
+        tilted = engine.simulate_scenario(self.test_scenario, seed=4)
+        
+        reference_metrics = StatisticsCalculator.calculate_risk_metrics(reference)
+        tilted_metrics = StatisticsCalculator.calculate_risk_metrics(tilted)
+        
+        self.assertAlmostEqual(np.mean(tilted.weights), 1, delta=0.1)
+        self.assertLess(np.mean(tilted.net_present_values), reference.mean_npv)
+        self.assertAlmostEqual(tilted.mean_npv, reference.mean_npv, delta=0.02 * reference.std_npv)
+        self.assertAlmostEqual(tilted_metrics['cvar_99'], reference_metrics['cvar_99'],
+                               delta=0.05 * reference.std_npv)
+        
+        uniform_cvar = StatisticsCalculator.weighted_cvar(reference.net_present_values, None, 0.05)
+        self.assertAlmostEqual(uniform_cvar, reference_metrics['cvar_95'], delta=0.01 * reference.std_npv)
+    
+    def test_simulate_many(self):
+        """Prueba la simulación vectorizada de varios escenarios y horizontes"""
+        engine = MonteCarloEngine(n_simulations=400, use_database=False)
+        long_horizon = BusinessScenario("Largo", 60000, 15000, 3000, 8000, 1500, time_horizon=24)
+        cheaper = BusinessScenario("Barato", 20000, 15000, 3000, 8000, 1500)
+        results = engine.simulate_many([self.test_scenario, long_horizon, cheaper], seed=8)
+        
+        self.assertEqual([r.scenario_name for r in results], ["Test Scenario", "Largo", "Barato"])
+        self.assertTrue(all(len(r.net_present_values) == 400 for r in results))
+        self.assertLessEqual(results[1].break_even_months.max(), 24)
+        
+        single = engine.simulate_scenario(self.test_scenario, seed=8)
+        np.testing.assert_allclose(results[0].net_present_values, single.net_present_values)
+        
+        # Con números aleatorios comunes solo cambia la inversión: NPV desplazado exactamente
+        common = engine.simulate_many([self.test_scenario, cheaper], common_random_numbers=True, seed=8)
+        np.testing.assert_allclose(common[1].net_present_values - common[0].net_present_values, 30000)
+    
+    def test_parallel_variance_reduction_error(self):
+        """Prueba que los bloques de cada proceso no se tratan como réplicas al estimar el error"""
+        options = dict(n_simulations=8000, use_database=False, antithetic=True, control_variate=True, seed=5)
+        serial = MonteCarloEngine(workers=1, **options).simulate_scenario(self.test_scenario, seed=5)
+        parallel = MonteCarloEngine(workers=2, **options).simulate_scenario(self.test_scenario, seed=5)
+        
+        self.assertAlmostEqual(parallel.std_error_npv, serial.std_error_npv, delta=serial.std_error_npv * 0.2)
+        successes = int(np.count_nonzero(parallel.net_present_values > 0))
+        self.assertAlmostEqual(parallel.std_error_success, MonteCarloEngine._success_std_error(successes, 8000))
+    
+    def test_common_random_numbers_across_blocks(self):
+        """Prueba que los números comunes se mantienen entre bloques de escenarios y de trayectorias"""
+        engine = MonteCarloEngine(n_simulations=1000, use_database=False)
+        engine.batch_size = 600
+        scenarios = [BusinessScenario(f"S{i}", 100000 - 1000 * i, 25000, 5000, 15000, 3000) for i in range(4)]
+        results = engine.simulate_many(scenarios, common_random_numbers=True, seed=3)
+        
+        for i, result in enumerate(results[1:], start=1):
+            np.testing.assert_allclose(result.net_present_values - results[0].net_present_values, 1000 * i)
+    
+    def test_sensitivity_common_random_numbers(self):
+        """Prueba que la sensibilidad vectorizada con números comunes da curvas suaves"""
+        engine = MonteCarloEngine(n_simulations=2000, use_database=False)
+        results = StatisticsCalculator.sensitivity_analysis(
+            self.test_scenario, engine,
+            {'revenue_mean': (10000, 20000, 6), 'time_horizon': (6, 18, 3)})
+        
+        npv_means = results['revenue_mean']['npv_means']
+        self.assertEqual(len(npv_means), 6)
+        self.assertTrue(np.all(np.diff(npv_means) > 0))
+        # Con normales comunes el NPV medio es prácticamente lineal en el ingreso medio
+        self.assertLess(np.ptp(np.diff(npv_means)), 0.01 * abs(np.mean(np.diff(npv_means))))
+        self.assertEqual(list(results['time_horizon']['values']), [6, 12, 18])
+    
+    def test_common_numbers_by_blocks(self):
+        """Prueba que las normales comunes por bloques no dependen del tamaño de bloque ni ocupan memoria por trayectoria"""
+        import tracemalloc
+        from dataclasses import replace
+        scenarios = [self.test_scenario, replace(self.test_scenario, revenue_mean=12000),
+                     replace(self.test_scenario, time_horizon=6)]
+        engine = MonteCarloEngine(n_simulations=3000, use_database=False)
+        means, probs = engine.summarize_common(scenarios, seed=4)
+        engine.batch_size = 256
+        np.testing.assert_allclose(engine.summarize_common(scenarios, seed=4), (means, probs))
+        single = engine.simulate_scenario(self.test_scenario, seed=4)
+        self.assertAlmostEqual(means[0], single.mean_npv, places=6)
+        self.assertAlmostEqual(probs[0], single.success_probability)
+        
+        engine = MonteCarloEngine(n_simulations=200000, use_database=False)
+        engine.batch_size = 5000
+        tracemalloc.start()
+        try:
+            engine.summarize_common(scenarios, seed=4)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        # Las normales de todas las trayectorias ocuparían 200000 × 4 × 12 × 8 bytes
+        self.assertLess(peak, 200000 * 4 * 12 * 8 / 4)
+    
+    def test_sobol_sensitivity_indices(self):
+        """Prueba los índices de Sobol y el progreso de la evaluación por lotes"""
+        engine = MonteCarloEngine(n_simulations=500, use_database=False)
+        progress = []
+        results = StatisticsCalculator.sobol_sensitivity(
+            self.test_scenario, engine,
+            {'revenue_mean': (10000, 20000), 'market_volatility': (0.05, 0.3), 'cost_mean': (6000, 10000)},
+            n_samples=128, seed=7, progress_callback=lambda done, total: progress.append((done, total)))
+        
+        self.assertEqual(results['n_evaluations'], 128 * 5)
+        self.assertEqual(progress[-1], (640, 640))
+        # El ingreso medio domina el NPV; la volatilidad apenas afecta a su media
+        self.assertGreater(results['revenue_mean']['first_order_npv'], 0.6)
+        self.assertGreater(results['revenue_mean']['first_order_npv'], results['cost_mean']['first_order_npv'])
+        self.assertLess(results['market_volatility']['total_effect_npv'], 0.05)
+        for name in ('revenue_mean', 'market_volatility', 'cost_mean'):
+            self.assertGreaterEqual(results[name]['total_effect_npv'], 0)
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file